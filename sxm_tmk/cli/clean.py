@@ -1,6 +1,8 @@
 import pathlib
 
-from sxm_tmk.core.conda.cache import CACHE_DIR, CondaCache
+from sxm_tmk.core.conda.cache import CACHE_DIR, create_cache
+from sxm_tmk.core.conda.storage import STORAGE_BACKENDS
+from sxm_tmk.core.config import CONFIG_PATH, load_settings, parse_size
 from sxm_tmk.core.out.terminal import Status, Terminal
 
 
@@ -12,7 +14,20 @@ def setup(subparser):
         default=CACHE_DIR,
         help=f"Path to a conda cache. Default is to use {CACHE_DIR.as_posix()}",
     )
+    clean_parser.add_argument(
+        "--cache-backend",
+        choices=list(STORAGE_BACKENDS),
+        default=None,
+        help=f"Storage backend of the conda cache. Default is taken from {CONFIG_PATH.as_posix()}, json otherwise.",
+    )
     clean_parser.add_argument("--aggressive", action="store_true", help="Remove all files in cache.")
+    clean_parser.add_argument(
+        "--max-size",
+        type=parse_size,
+        default=None,
+        help="Evict least recently used entries until the cache fits in this size (e.g. 2G). "
+        f"Default is taken from {CONFIG_PATH.as_posix()}.",
+    )
     clean_parser.set_defaults(func=main)
 
 
@@ -28,11 +43,25 @@ def main(options):
         return 1
     Terminal().step("Cache is healthy", True)
 
-    cache = CondaCache(options.conda_cache)
+    settings = load_settings()
+    if options.cache_backend is not None:
+        settings.cache.backend = options.cache_backend
+    if options.max_size is not None:
+        settings.cache.max_size = options.max_size
+
+    cache = create_cache(settings, options.conda_cache)
     state = Status("Cleaning ...")
     with state:
         res = cache.clean(options.aggressive)
 
     Terminal().info(f"Files deleted: {res['deleted']}")
+    Terminal().info(f"Not found packages forgotten: {res['not-found-deleted']}")
     Terminal().info(f"Space claimed: {res['space-claimed'] / 1024:.2f} KB")
+
+    if settings.cache.max_size is not None and not options.aggressive:
+        state = Status("Evicting ...")
+        with state:
+            res = cache.evict(settings.cache.max_size)
+        Terminal().info(f"Files evicted: {res['deleted']}")
+        Terminal().info(f"Space claimed: {res['space-claimed'] / 1024:.2f} KB")
     return 0
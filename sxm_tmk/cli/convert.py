@@ -1,6 +1,11 @@
 import pathlib
 
 from sxm_tmk.converters.pipenv import FromPipenv
+from sxm_tmk.core.conda.async_repo import QUERY_ENGINES
+from sxm_tmk.core.conda.backends import AUTO_BACKEND, SEARCH_BACKENDS
+from sxm_tmk.core.conda.compression import COMPRESSIONS
+from sxm_tmk.core.conda.storage import STORAGE_BACKENDS
+from sxm_tmk.core.config import CONFIG_PATH, load_settings, parse_size
 from sxm_tmk.core.custom_types import TMKLockFileNotFound
 from sxm_tmk.core.out.terminal import Terminal
 
@@ -25,13 +30,93 @@ def setup(subparser):
         help="Do not consider development dependencies during migration."
         "Default behaviour is to take them into account.",
     )
+    convert_parser.add_argument(
+        "--cache-backend",
+        choices=list(STORAGE_BACKENDS),
+        default=None,
+        help=f"Storage backend of the conda cache. Default is taken from {CONFIG_PATH.as_posix()}, json otherwise.",
+    )
+    convert_parser.add_argument(
+        "--cache-compression",
+        choices=list(COMPRESSIONS),
+        default=None,
+        help="Compression of the conda cache entries written by this run, entries are decoded whatever their "
+        f"compression. Default is taken from {CONFIG_PATH.as_posix()}, none otherwise.",
+    )
+    convert_parser.add_argument(
+        "--max-size",
+        type=parse_size,
+        default=None,
+        help="Maximum size of the conda cache (e.g. 2G). Least recently used entries are evicted beyond it. "
+        f"Default is taken from {CONFIG_PATH.as_posix()}, unbounded otherwise.",
+    )
+    convert_parser.add_argument(
+        "-c",
+        "--channel",
+        action="append",
+        dest="channels",
+        default=None,
+        help="Conda channel to search packages in, may be repeated. "
+        f"Default is taken from {CONFIG_PATH.as_posix()}, the channels of your .condarc otherwise.",
+    )
+    convert_parser.add_argument(
+        "--subdir",
+        default=None,
+        help="Conda platform subdir to search packages for (e.g. linux-64). Default is the current platform.",
+    )
+    convert_parser.add_argument(
+        "--search-backend",
+        choices=[AUTO_BACKEND, *SEARCH_BACKENDS],
+        default=None,
+        help="How packages are searched: with conda, mamba or micromamba, or by reading repodata.json files in "
+        "process. auto picks the installed one starting the fastest. "
+        f"Default is taken from {CONFIG_PATH.as_posix()}, auto otherwise.",
+    )
+    convert_parser.add_argument(
+        "--engine",
+        choices=list(QUERY_ENGINES),
+        default=None,
+        help="Run searches from a pool of --jobs threads, or as asyncio subprocesses with up to --jobs searches in "
+        f"flight. Default is taken from {CONFIG_PATH.as_posix()}, threads otherwise.",
+    )
+    convert_parser.add_argument(
+        "--repodata",
+        action="append",
+        default=None,
+        help="repodata.json file or local channel directory read by the repodata backend, may be repeated. "
+        "Default is to read the repodata cached by conda and mamba.",
+    )
+    convert_parser.add_argument(
+        "--no-name-mapping",
+        action="store_true",
+        help="Search PyPI projects under their own name rather than their conda name (see tmk mapping).",
+    )
     convert_parser.set_defaults(func=main)
 
 
 def main(options):
     Terminal("rich")
+    settings = load_settings()
+    if options.cache_backend is not None:
+        settings.cache.backend = options.cache_backend
+    if options.cache_compression is not None:
+        settings.cache.compression = options.cache_compression
+    if options.max_size is not None:
+        settings.cache.max_size = options.max_size
+    if options.channels is not None:
+        settings.search.channels = options.channels
+    if options.subdir is not None:
+        settings.search.subdir = options.subdir
+    if options.search_backend is not None:
+        settings.search.backend = options.search_backend
+    if options.engine is not None:
+        settings.search.engine = options.engine
+    if options.repodata is not None:
+        settings.search.repodata = options.repodata
+    if options.no_name_mapping:
+        settings.search.name_mapping = False
     try:
-        processor = FromPipenv(options.path.resolve(), options.jobs, not options.no_dev)
+        processor = FromPipenv(options.path.resolve(), options.jobs, not options.no_dev, settings=settings)
         return processor.convert()
     except TMKLockFileNotFound as e:
         Terminal().error(str(e))
@@ -0,0 +1,58 @@
+from sxm_tmk.core.conda.name_mapping import (
+    TABLE_PATH,
+    build_name_mapping,
+    load_name_mapping,
+)
+from sxm_tmk.core.conda.repodata import RepodataSearch
+from sxm_tmk.core.config import CONFIG_PATH, load_settings
+from sxm_tmk.core.out.terminal import Status, Terminal
+
+
+def setup(subparser):
+    mapping_parser = subparser.add_parser(name="mapping")
+    mapping_parser.add_argument(
+        "names",
+        nargs="*",
+        help="PyPI project names to look up in the PyPI to conda name mapping.",
+    )
+    mapping_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help=f"Rebuild the mapping from the repodata of the channels and store it at {TABLE_PATH.as_posix()}.",
+    )
+    mapping_parser.add_argument(
+        "--repodata",
+        action="append",
+        default=None,
+        help="repodata.json file or local channel directory to rebuild the mapping from, may be repeated. "
+        f"Default is taken from {CONFIG_PATH.as_posix()}, the repodata cached by conda and mamba otherwise.",
+    )
+    mapping_parser.set_defaults(func=main)
+
+
+def main(options):
+    Terminal("rich")
+    settings = load_settings()
+    if options.refresh:
+        method = RepodataSearch(
+            channels=settings.search.channels,
+            subdir=settings.search.subdir,
+            paths=options.repodata if options.repodata is not None else settings.search.repodata,
+        )
+        state = Status("Reading repodata ...")
+        with state:
+            indexes = method.indexes()
+            conda_names = {name for index in indexes for name in index.names()}
+        if not conda_names:
+            Terminal().step("No repodata found, run a conda search first or give --repodata", False)
+            return 1
+        name_mapping = build_name_mapping(conda_names)
+        name_mapping.dump()
+        Terminal().info(f"Repodata read: {len(indexes)}")
+        Terminal().info(f"Conda packages: {len(conda_names)}, names differing from PyPI: {len(name_mapping.mapping)}")
+    else:
+        name_mapping = load_name_mapping()
+
+    for name in options.names:
+        Terminal().info(f"{name} -> {name_mapping.conda_name(name) or 'not on conda'}")
+    return 0
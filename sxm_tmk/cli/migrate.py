@@ -0,0 +1,39 @@
+import pathlib
+
+from sxm_tmk.core.conda.cache import CACHE_DIR, CondaCache
+from sxm_tmk.core.conda.storage import STORAGE_BACKENDS
+from sxm_tmk.core.out.terminal import Status, Terminal
+
+
+def setup(subparser):
+    migrate_parser = subparser.add_parser(name="migrate")
+    migrate_parser.add_argument(
+        "--conda-cache",
+        type=pathlib.Path,
+        default=CACHE_DIR,
+        help=f"Path to a conda cache. Default is to use {CACHE_DIR.as_posix()}",
+    )
+    migrate_parser.add_argument(
+        "--to",
+        dest="backend",
+        choices=[backend for backend in STORAGE_BACKENDS if backend != "json"],
+        default="sqlite",
+        help="Storage backend to migrate the json entries to. Default is sqlite.",
+    )
+    migrate_parser.add_argument("--keep", action="store_true", help="Keep json files once migrated.")
+    migrate_parser.set_defaults(func=main)
+
+
+def main(options):
+    Terminal("rich")
+    if not options.conda_cache.exists():
+        Terminal().step("Invalid cache (no such dir)", False)
+        return 1
+
+    cache = CondaCache(options.conda_cache, backend=options.backend)
+    state = Status("Migrating ...")
+    with state:
+        migrated = cache.migrate_json_entries(keep_files=options.keep)
+
+    Terminal().info(f"Entries migrated: {migrated}")
+    return 0
@@ -5,6 +5,8 @@ from sxm_tmk import __version__ as version
 from sxm_tmk.cli.clean import setup as setup_clean
 from sxm_tmk.cli.convert import setup as setup_convert
 from sxm_tmk.cli.create import setup as setup_create
+from sxm_tmk.cli.mapping import setup as setup_mapping
+from sxm_tmk.cli.migrate import setup as setup_migrate
 
 
 def main(args=None):
@@ -15,6 +17,8 @@ def main(args=None):
     setup_convert(parsers)
     setup_clean(parsers)
     setup_create(parsers)
+    setup_migrate(parsers)
+    setup_mapping(parsers)
 
     options = parser.parse_args(args)
     if hasattr(options, "func"):
@@ -1,18 +1,29 @@
+import dataclasses
 import pathlib
-from typing import Optional
+from typing import Dict, List, Optional
 
 from sxm_tmk.converters.base import Base
-from sxm_tmk.core.conda.cache import CondaCache, PackageCacheExtractor
-from sxm_tmk.core.conda.repo import QueryPlan
+from sxm_tmk.core.conda.async_repo import create_query_plan
+from sxm_tmk.core.conda.cache import PackageCacheExtractor, create_cache
+from sxm_tmk.core.conda.channels import normalize_channels
+from sxm_tmk.core.conda.name_mapping import load_name_mapping
+from sxm_tmk.core.conda.repo import BaseQueryPlan
 from sxm_tmk.core.conda.specifications import Environment
+from sxm_tmk.core.config import Settings
 from sxm_tmk.core.custom_types import InstallMode, Packages, PinnedPackages
-from sxm_tmk.core.dependency import PinnedPackage
+from sxm_tmk.core.dependency import PinnedPackage, parsing_memo_stats
 from sxm_tmk.core.env_manager.pipenv.lock import LockFile
 from sxm_tmk.core.out.terminal import Progress, Section, Status, Terminal
 
 
 class FromPipenv(Base):
-    def __init__(self, path_to_project: pathlib.Path, jobs: Optional[int] = None, dev_mode: bool = False):
+    def __init__(
+        self,
+        path_to_project: pathlib.Path,
+        jobs: Optional[int] = None,
+        dev_mode: bool = False,
+        settings: Optional[Settings] = None,
+    ):
         super().__init__()
         self.__pipfile_lock = LockFile(path_to_project)
         self.__pipfile_lock.mode = InstallMode.DEV if dev_mode else InstallMode.DEFAULT
@@ -22,7 +33,22 @@ class FromPipenv(Base):
         self.__solved_constraints: Packages = []
         self.__conda_packages: Packages = []
         self.__pip_packages: Packages = []
-        self.__cache = CondaCache()
+        self.__settings = settings or Settings()
+        self.__cache = create_cache(self.__settings)
+        self.__name_mapping = load_name_mapping() if self.__settings.search.name_mapping else None
+
+    def _query_plan(self) -> BaseQueryPlan:
+        return create_query_plan(
+            self.__settings.search.engine,
+            jobs=self.__max_jobs,
+            cache=self.__cache,
+            channels=self.__settings.search.channels,
+            subdir=self.__settings.search.subdir,
+            backend=self.__settings.search.backend,
+            repodata=self.__settings.search.repodata,
+            timeout=self.__settings.search.timeout,
+            retries=self.__settings.search.retries,
+        )
 
     def _read_env_constraints(self):
         step = Status("Building profile ...")
@@ -38,11 +64,11 @@ class FromPipenv(Base):
         progress = Progress("")
         this_task = progress.add_task("Fetching package info", len(self.__env_constrained_pkg))
         with progress:
-            q = QueryPlan(jobs=self.__max_jobs, cache=self.__cache)
+            q = self._query_plan()
             xtractor = PackageCacheExtractor(self.__cache)
             q.search_and_mark(self.__env_constrained_pkg, this_task)
             for constrained_package in self.__env_constrained_pkg:
-                valid_pkg = xtractor.extract_pinned_packages(constrained_package, self.__solved_constraints)
+                valid_pkg = xtractor.extract_best(constrained_package, self.__solved_constraints)
                 if valid_pkg:
                     self.__solved_constraints.append(valid_pkg[0])
         step_success = len(self.__solved_constraints) == len(self.__env_constrained_pkg)
@@ -55,29 +81,69 @@ class FromPipenv(Base):
     def _solve_dependencies(self):
         progress = Progress("")
         project_dependencies = self.__pipfile_lock.list_dependencies()
-        this_task = progress.add_task("Fetching package info", len(project_dependencies))
-        q = QueryPlan(jobs=self.__max_jobs, cache=self.__cache)
+        # Projects are searched under their conda name, the ones that cannot be on conda are not searched at all.
+        # Several projects may share a conda name (e.g. opencv-python and opencv-python-headless): it is searched once.
+        pypi_names: Dict[str, List[str]] = {}
+        searched_dependencies: PinnedPackages = []
+        for dependency in project_dependencies:
+            conda_name = self.__name_mapping.conda_name(dependency.name) if self.__name_mapping else dependency.name
+            if conda_name is None:
+                self.__pip_packages.append(self.__pipfile_lock.get_package(dependency.name))
+            elif conda_name in pypi_names:
+                pypi_names[conda_name].append(dependency.name)
+            else:
+                pypi_names[conda_name] = [dependency.name]
+                searched_dependencies.append(dataclasses.replace(dependency, name=conda_name))
+        this_task = progress.add_task("Fetching package info", len(searched_dependencies))
+        q = self._query_plan()
         with progress:
-            q.search_and_mark(project_dependencies, this_task)
+            q.search_and_mark(searched_dependencies, this_task)
         this_status = Terminal().new_status("Solving")
         with this_status:
             xtractor = PackageCacheExtractor(self.__cache)
             for package in q.found_pkgs:
-                this_pkg = self.__pipfile_lock.get_package(package)
-                valid_pkg = xtractor.extract_packages(this_pkg, self.__solved_constraints)
+                pypi_packages = [self.__pipfile_lock.get_package(name) for name in pypi_names[package]]
+                this_pkg = dataclasses.replace(pypi_packages[0], name=package)
+                valid_pkg = xtractor.extract_best(this_pkg, self.__solved_constraints)
                 if valid_pkg:
                     self.__conda_packages.append(valid_pkg[0])
                 else:
-                    self.__pip_packages.append(self.__pipfile_lock.get_package(package))
+                    self.__pip_packages.extend(pypi_packages)
 
             for not_found_package in q.not_found_pkgs:
-                self.__pip_packages.append(self.__pipfile_lock.get_package(not_found_package))
+                self.__pip_packages.extend(
+                    self.__pipfile_lock.get_package(name) for name in pypi_names[not_found_package]
+                )
+
+            # Whether conda has them is unknown: keep them installable rather than dropping them.
+            for failed_package in q.failed_pkgs:
+                self.__pip_packages.extend(self.__pipfile_lock.get_package(name) for name in pypi_names[failed_package])
+        if q.failed_pkgs:
+            Terminal().warning(
+                f"Searching {', '.join(name for pkg in q.failed_pkgs for name in pypi_names[pkg])} failed, "
+                "they are installed with pip. Run the conversion again to search them on conda channels."
+            )
 
     def convert(self):
         self._read_env_constraints()
         self._solve_env_constraints()
         self._solve_dependencies()
         self.dump_environment()
+        self._report_cache_contention()
+        self._report_parsing_memos()
+
+    def _report_cache_contention(self):
+        for mode, stats in self.__cache.lock_statistics.items():
+            Terminal().debug(
+                f"Cache lock ({mode}): {stats['acquisitions']} acquisitions, {stats['contended']} contended, "
+                f"{stats['total_wait']:.3f}s waited (max {stats['max_wait']:.3f}s)"
+            )
+
+    def _report_parsing_memos(self):
+        for name, stats in parsing_memo_stats().items():
+            Terminal().debug(
+                f"Parsing memo ({name}): {stats['hits']} hits, {stats['misses']} misses, {stats['size']} kept"
+            )
 
     def dump_environment(self):
         this_status = Terminal().new_status("Writing conda specification for your environment ...")
@@ -86,6 +152,9 @@ class FromPipenv(Base):
             dir_name = self.__path.name
             path = path / f"{dir_name}.conda.yaml"
             env = Environment(name=dir_name)
+            for channel in normalize_channels(self.__settings.search.channels):
+                if channel not in env.conda.channels:
+                    env.conda.channels.append(channel)
 
             env.conda.packages.extend(self.__solved_constraints)
             env.conda.packages.extend(self.__conda_packages)
@@ -0,0 +1,151 @@
+import asyncio
+import contextlib
+from typing import Dict, List, Optional, Type
+
+from sxm_tmk.core.conda.cache import Freshness
+from sxm_tmk.core.conda.commands import CommandSearch
+from sxm_tmk.core.conda.repo import (
+    BaseQueryPlan,
+    QueryPlan,
+    SearchMethod,
+    SearchResult,
+    SearchStatus,
+    claim_batch,
+    claim_search,
+    release_all,
+    searched_batch_results,
+    searched_result,
+    split_cached,
+)
+from sxm_tmk.core.custom_types import Packages
+from sxm_tmk.core.out.terminal import Progress
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    with contextlib.suppress(ProcessLookupError):
+        process.kill()
+    await process.wait()
+
+
+async def _run_once(method: CommandSearch, spec: str) -> Optional[str]:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *method.search_command(spec), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        # e.g. the command is not installed, or no more processes can be spawned.
+        return None
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), method.timeout)
+    except asyncio.TimeoutError:
+        await _kill(process)
+        return None
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+    return method.answer(stdout.decode("utf8"))
+
+
+async def run_search(method: SearchMethod, pkgs: List[str]) -> Optional[str]:
+    """
+    Searches packages without holding a thread while the search command runs, retrying as CommandSearch.searches
+    says. Returns None when the search fails. The command is killed when the search times out or is cancelled.
+    """
+    if not isinstance(method, CommandSearch):
+        # Answered in process, there is nothing to wait for.
+        return method.execute_many(pkgs)
+    searches = method.searches(pkgs)
+    try:
+        delay, spec = next(searches)
+        while True:
+            await asyncio.sleep(delay)
+            delay, spec = searches.send(await _run_once(method, spec))
+    except StopIteration as stop:
+        return stop.value
+
+
+class AsyncQueryPlan(BaseQueryPlan):
+    """
+    QueryPlan running searches as asyncio subprocesses: in-flight searches (at most jobs) do not hold a thread each,
+    so that large lock files can be fetched with hundreds of searches in flight.
+    """
+
+    async def _search_claimed(
+        self, semaphore: asyncio.Semaphore, method: SearchMethod, pkg: str, progress_track: Progress.Task
+    ) -> SearchResult:
+        async with semaphore:
+            data = await run_search(method, [pkg])
+        return searched_result(pkg, data, self.cache, progress_track)
+
+    async def _search(
+        self, semaphore: asyncio.Semaphore, method: SearchMethod, pkg: str, progress_track: Progress.Task
+    ) -> SearchResult:
+        while True:
+            result, claimed = claim_search(pkg, self.cache, progress_track)
+            if result is not None:
+                return result
+            if claimed:
+                break
+            await self.cache.single_flight.wait_async(pkg)
+        try:
+            return await self._search_claimed(semaphore, method, pkg, progress_track)
+        finally:
+            self.cache.single_flight.release(pkg)
+
+    async def _search_batch(
+        self, semaphore: asyncio.Semaphore, method: SearchMethod, pkgs: List[str], progress_track: Progress.Task
+    ) -> List[SearchResult]:
+        if len(pkgs) == 1:
+            return [await self._search(semaphore, method, pkgs[0], progress_track)]
+        results, claimed, others = claim_batch(pkgs, self.cache, progress_track)
+        try:
+            if len(claimed) == 1:
+                results.append(await self._search_claimed(semaphore, method, claimed[0], progress_track))
+            elif claimed:
+                async with semaphore:
+                    data = await run_search(method, claimed)
+                batch_results = searched_batch_results(claimed, data, self.cache, progress_track)
+                if batch_results is None:
+                    batch_results = await asyncio.gather(
+                        *(self._search_claimed(semaphore, method, pkg, progress_track) for pkg in claimed)
+                    )
+                results.extend(batch_results)
+        finally:
+            release_all(claimed, self.cache)
+        others_results = await asyncio.gather(*(self._search(semaphore, method, pkg, progress_track) for pkg in others))
+        return results + list(others_results)
+
+    async def _search_and_mark(self, names: List[str], progress_track: Progress.Task) -> Dict[str, SearchStatus]:
+        semaphore = asyncio.Semaphore(self.jobs)
+        self.revalidator.submit([pkg for pkg in names if self.cache.freshness(pkg) is Freshness.STALE])
+        cached, missing = split_cached(names, self.cache, progress_track)
+        results = {pkg: status for status, pkg in cached}
+        if not missing:
+            return results
+        warm_up_method = self._create_search(use_index=False)
+        method = self._create_search(use_index=True)
+        status, pkg = await self._search(semaphore, warm_up_method, missing[0], progress_track)
+        results[pkg] = status
+
+        # Cancelling one search (e.g. on KeyboardInterrupt) cancels the others, which kill their command.
+        for batch_results in await asyncio.gather(
+            *(self._search_batch(semaphore, method, batch, progress_track) for batch in self._batches(missing[1:]))
+        ):
+            for status, pkg in batch_results:
+                results[pkg] = status
+        return results
+
+    def search_and_mark(self, packages: Packages, progress_track: Progress.Task):
+        names = [package.name for package in packages]
+        self._aggregate_results(names, asyncio.run(self._search_and_mark(names, progress_track)))
+
+
+QUERY_ENGINES: Dict[str, Type[BaseQueryPlan]] = {"threads": QueryPlan, "asyncio": AsyncQueryPlan}
+
+
+def create_query_plan(engine: str = "threads", **kwargs) -> BaseQueryPlan:
+    try:
+        plan_class = QUERY_ENGINES[engine]
+    except KeyError:
+        raise ValueError(f'Unknown query engine "{engine}". Use one of {", ".join(QUERY_ENGINES)}.')
+    return plan_class(**kwargs)
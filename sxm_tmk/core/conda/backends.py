@@ -0,0 +1,83 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from sxm_tmk.core.conda.commands import (
+    SEARCH_RETRIES,
+    SEARCH_TIMEOUT,
+    CondaSearch,
+    MambaSearch,
+    MicromambaSearch,
+    SearchBackend,
+)
+from sxm_tmk.core.conda.repodata import RepodataSearch
+
+SEARCH_BACKENDS: Dict[str, Type[SearchBackend]] = {
+    "conda": CondaSearch,
+    "mamba": MambaSearch,
+    "micromamba": MicromambaSearch,
+    "repodata": RepodataSearch,
+}
+AUTO_BACKEND = "auto"
+# Searched with when none of the backends is found installed, errors then being reported by the searches.
+FALLBACK_BACKEND = "mamba"
+
+
+def create_backend(
+    backend: str,
+    channels: Optional[List[str]] = None,
+    subdir: Optional[str] = None,
+    repodata: Iterable[str] = (),
+    timeout: Optional[float] = SEARCH_TIMEOUT,
+    retries: int = SEARCH_RETRIES,
+) -> SearchBackend:
+    try:
+        backend_class = SEARCH_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f'Unknown search backend "{backend}". Use one of {", ".join([AUTO_BACKEND, *SEARCH_BACKENDS])}.'
+        )
+    if backend_class is RepodataSearch:
+        return RepodataSearch(channels=channels, subdir=subdir, paths=repodata)
+    return backend_class(channels=channels, subdir=subdir, timeout=timeout, retries=retries)
+
+
+@functools.lru_cache(maxsize=None)
+def probe_backend(backend: str, repodata: Tuple[str, ...] = ()) -> Optional[float]:
+    """
+    Startup latency of a backend, None when it is not available. Measured once per process.
+    """
+    return create_backend(backend, repodata=repodata).probe()
+
+
+def select_backend(repodata: Iterable[str] = ()) -> str:
+    """
+    The available backend starting the fastest. Starting conda, mamba or micromamba is most of the time a search
+    takes when the channel indexes are cached, and their startup latency differs by an order of magnitude.
+    The repodata backend is only a candidate when repodata files are configured: the indexes cached by conda may be
+    incomplete or outdated.
+    """
+    repodata = tuple(repodata)
+    candidates = [backend for backend in SEARCH_BACKENDS if backend != "repodata" or repodata]
+    with ThreadPoolExecutor(max_workers=len(candidates)) as tp:
+        latencies = dict(zip(candidates, tp.map(lambda backend: probe_backend(backend, repodata), candidates)))
+    available = {backend: latency for backend, latency in latencies.items() if latency is not None}
+    if not available:
+        return FALLBACK_BACKEND
+    return min(available, key=lambda backend: available[backend])
+
+
+def resolve_backend(backend: str, repodata: Iterable[str] = ()) -> str:
+    return select_backend(repodata) if backend == AUTO_BACKEND else backend
+
+
+def create_search(
+    backend: str = AUTO_BACKEND,
+    channels: Optional[List[str]] = None,
+    subdir: Optional[str] = None,
+    repodata: Iterable[str] = (),
+    timeout: Optional[float] = SEARCH_TIMEOUT,
+    retries: int = SEARCH_RETRIES,
+) -> SearchBackend:
+    repodata = list(repodata)
+    return create_backend(resolve_backend(backend, repodata), channels, subdir, repodata, timeout, retries)
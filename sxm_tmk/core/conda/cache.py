@@ -1,89 +1,301 @@
 import datetime
-import functools
+import enum
+import itertools
 import pathlib
-from typing import Callable, Optional
+import threading
+from typing import Dict, Iterator, List, Optional
 
 import ujson
+from packaging.specifiers import Specifier
 
+from sxm_tmk.core.conda.channels import cache_namespace, current_subdir
+from sxm_tmk.core.conda.compression import check_compression, compress, decompress
 from sxm_tmk.core.conda.file_lock_wrapper import (
-    LockMixin,
+    StripedLockMixin,
     ensure_lock_on_public_interface_call,
 )
+from sxm_tmk.core.conda.memo import EntryMemo
+from sxm_tmk.core.conda.record import (
+    RECORD_FORMAT,
+    BuildIndex,
+    BuildRecord,
+    CacheRecord,
+    project_search_result,
+)
+from sxm_tmk.core.conda.single_flight import SingleFlight
+from sxm_tmk.core.conda.storage import (
+    CacheStorage,
+    JSONDirectoryStorage,
+    create_storage,
+    migrate_json_directory,
+)
+from sxm_tmk.core.config import Settings
 from sxm_tmk.core.custom_types import Constraints, Packages
-from sxm_tmk.core.dependency import Constraint, Package, PinnedPackage
+from sxm_tmk.core.dependency import Package, PinnedPackage
 
 CACHE_DIR: pathlib.Path = pathlib.Path.home() / ".sxm_tmk" / "conda_query_cache"
+EVICTION_HEADROOM = 0.1
+# Packages not found on conda channels are remembered for a shorter time than found ones: they may get published.
+NOT_FOUND_TTL = 6 * 3600
+NOT_FOUND_SUFFIX = ".not-found"
+# Entries older than SOFT_TTL are served but refreshed in background, entries older than HARD_TTL are searched again.
+SOFT_TTL = 24 * 3600
+HARD_TTL = 30 * 24 * 3600
+# Files interrupted writes left behind are discarded once older than this.
+LEFTOVER_TTL = 24 * 3600
+
 
+class Freshness(enum.Enum):
+    FRESH = "fresh"
+    STALE = "stale"
+    EXPIRED = "expired"
+    MISSING = "missing"
 
-def compute_expiry_time(force_now: bool = False) -> float:
+
+def compute_expiry_time(force_now: bool = False, ttl: Optional[float] = LEFTOVER_TTL) -> float:
+    """
+    Entries queried before the returned time are expired, none of them when ttl is None.
+    """
     if force_now:
         return datetime.datetime.now().timestamp()
-    now = datetime.datetime.now() - datetime.timedelta(days=1)
+    if ttl is None:
+        return 0.0
+    now = datetime.datetime.now() - datetime.timedelta(seconds=ttl)
     return now.timestamp()
 
 
-@ensure_lock_on_public_interface_call()
-class CondaCache(LockMixin):
-    def __init__(self, cache_dir: Optional[pathlib.Path] = None):
+# Writes are atomic (see CacheStorage implementations): reading the cache does not require to lock it.
+# Stores of different packages only contend when their names fall in the same lock stripe.
+@ensure_lock_on_public_interface_call(
+    lock_free=("get", "builds", "build_index", "freshness", "is_known_missing", "__contains__", "__getitem__"),
+    striped=("store", "store_not_found"),
+)
+class CondaCache(StripedLockMixin):
+    def __init__(
+        self,
+        cache_dir: Optional[pathlib.Path] = None,
+        backend: str = "json",
+        memo_size: int = 256,
+        max_size: Optional[int] = None,
+        channels: Optional[List[str]] = None,
+        subdir: Optional[str] = None,
+        compression: str = "none",
+        not_found_ttl: float = NOT_FOUND_TTL,
+        soft_ttl: float = SOFT_TTL,
+        hard_ttl: Optional[float] = HARD_TTL,
+    ):
+        self.__compression = check_compression(compression)
         self.__cache_dir: pathlib.Path = cache_dir or CACHE_DIR
         if not self.__cache_dir.exists():
             self.__cache_dir.mkdir(parents=True, exist_ok=True)
         lock_file_path: pathlib.Path = self.__cache_dir / "tmk.lock"
         lock_file_path.touch(exist_ok=True)
         super().__init__(lock_file_path)
+        self.__storage: CacheStorage = create_storage(backend, self.__cache_dir)
+        self.__memo = EntryMemo(memo_size)
+        self.__max_size = max_size
+        self.__budget_lock = threading.Lock()
+        self.__size_estimate: Optional[int] = None
+        self.__not_found_ttl = not_found_ttl
+        self.__soft_ttl = soft_ttl
+        self.__hard_ttl = hard_ttl
+        self.__namespace = cache_namespace(channels, subdir)
+        self.__single_flight = SingleFlight(self.__cache_dir, key=self._key)
+        # Before keys were namespaced, entries were searched against the channels of the user .condarc, for the host
+        # platform.
+        self.__read_legacy_keys = not channels and subdir in (None, current_subdir())
+
+    @property
+    def namespace(self) -> str:
+        return self.__namespace
+
+    @property
+    def single_flight(self) -> SingleFlight:
+        return self.__single_flight
+
+    def _key(self, pkg: str) -> str:
+        return f"{pkg}@{self.__namespace}"
+
+    def _not_found_key(self, pkg: str) -> str:
+        return f"{self._key(pkg)}{NOT_FOUND_SUFFIX}"
+
+    def _lookup_keys(self, pkg: str) -> List[str]:
+        return [self._key(pkg), pkg] if self.__read_legacy_keys else [self._key(pkg)]
+
+    @property
+    def memo_stats(self) -> Dict[str, int]:
+        return self.__memo.stats
 
     def clean(self, now: bool = False):
-        expiry_time = compute_expiry_time(now)
-        delete_file = None
+        # Entries a search would not use anymore, see freshness.
+        expiry_time = compute_expiry_time(now, self.__hard_ttl)
+        not_found_expiry_time = max(expiry_time, datetime.datetime.now().timestamp() - self.__not_found_ttl)
 
-        res = {"deleted": 0, "space-claimed": 0}
+        res = {"deleted": 0, "not-found-deleted": 0, "space-claimed": 0}
 
-        for pkg_file_query in self.__cache_dir.iterdir():
-            if delete_file is not None:
+        for entry in list(self.__storage.entries()):
+            is_not_found = entry.key.endswith(NOT_FOUND_SUFFIX)
+            if entry.query_date is not None and entry.query_date >= (
+                not_found_expiry_time if is_not_found else expiry_time
+            ):
+                continue
+            counter = "not-found-deleted" if is_not_found else "deleted"
+            res[counter] = res[counter] + 1
+            res["space-claimed"] = res["space-claimed"] + self.__storage.delete(entry.key)
+        res["space-claimed"] = res["space-claimed"] + self.__storage.discard_leftovers(compute_expiry_time(now))
+        self.__memo.invalidate()
+        with self.__budget_lock:
+            self.__size_estimate = None
+        return res
+
+    def _evict(self, max_size: int, keep: Optional[str] = None) -> Dict[str, int]:
+        res = {"deleted": 0, "space-claimed": 0, "size": 0}
+        entries = list(self.__storage.entries())
+        total_size = sum(entry.size for entry in entries)
+        if total_size > max_size:
+            # Going below the budget avoids evicting again on each of the next stores.
+            target_size = int(max_size * (1 - EVICTION_HEADROOM))
+            for entry in sorted(entries, key=lambda e: e.last_access or e.query_date or 0.0):
+                if total_size <= target_size:
+                    break
+                if entry.key == keep:
+                    continue
+                claimed = self.__storage.delete(entry.key)
+                self.__memo.invalidate(entry.key)
+                total_size -= claimed
                 res["deleted"] = res["deleted"] + 1
-                res["space-claimed"] = res["space-claimed"] + delete_file.stat().st_size
-                delete_file.unlink()
-                delete_file = None
-            if pkg_file_query.suffix == ".json":
-                data = ujson.loads(pkg_file_query.read_text())
-                try:
-                    delete_file = pkg_file_query if data["sxm_tmk"]["query_date"] < expiry_time else None
-                except KeyError:
-                    delete_file = pkg_file_query
-        if delete_file is not None:
-            res["deleted"] = res["deleted"] + 1
-            res["space-claimed"] = res["space-claimed"] + delete_file.stat().st_size
-            delete_file.unlink()
+                res["space-claimed"] = res["space-claimed"] + claimed
+        res["size"] = total_size
+        return res
+
+    def _enforce_budget(self, stored_pkg: str, stored_size: int):
+        if self.__max_size is None:
+            return
+        with self.__budget_lock:
+            # The estimate ignores what other processes stored: the actual size is only computed when the estimate
+            # goes over budget, which is also when we need to list entries to evict the least recently used ones.
+            if self.__size_estimate is not None:
+                self.__size_estimate += stored_size
+                if self.__size_estimate <= self.__max_size:
+                    return
+            self.__size_estimate = self._evict(self.__max_size, keep=stored_pkg)["size"]
+
+    def evict(self, max_size: int) -> Dict[str, int]:
+        """
+        Evicts the least recently used entries until the cache fits in max_size bytes.
+        """
+        with self.__budget_lock:
+            res = self._evict(max_size)
+            self.__size_estimate = res["size"]
         return res
 
+    def migrate_json_entries(self, keep_files: bool = False) -> int:
+        if isinstance(self.__storage, JSONDirectoryStorage):
+            return 0
+        return migrate_json_directory(self.__storage, keep_files)
+
     def store(self, pkg: str, content: str):
-        pkg_file = self.__cache_dir / f"{pkg}.json"
-        if pkg_file.exists():
-            pkg_file.unlink()
-        json_data = ujson.loads(content)
-        json_data["sxm_tmk"] = {"query_date": datetime.datetime.now().timestamp()}
-        with pkg_file.open("w") as f:
-            ujson.dump(json_data, f)
+        query_date = datetime.datetime.now().timestamp()
+        record = project_search_result(ujson.loads(content))
+        record["sxm_tmk"] = {"query_date": query_date, "format": RECORD_FORMAT, "namespace": self.__namespace}
+        payload = compress(ujson.dumps(record).encode("utf8"), self.__compression)
+        key = self._key(pkg)
+        self.__storage.write(key, payload, query_date)
+        self.__storage.delete(self._not_found_key(pkg))
+        self.__memo.invalidate(key)
+        self._enforce_budget(key, len(payload))
+
+    def store_not_found(self, pkg: str):
+        """
+        Records that channels do not provide pkg, see is_known_missing.
+        """
+        query_date = datetime.datetime.now().timestamp()
+        record = {"sxm_tmk": {"query_date": query_date, "format": RECORD_FORMAT, "namespace": self.__namespace}}
+        payload = compress(ujson.dumps(record).encode("utf8"), self.__compression)
+        key = self._not_found_key(pkg)
+        self.__storage.write(key, payload, query_date)
+        # The package is not provided anymore: the builds found by a previous search must not be used.
+        self.__storage.delete(self._key(pkg))
+        self.__memo.invalidate(self._key(pkg))
+        self._enforce_budget(key, len(payload))
+
+    def freshness(self, item) -> Freshness:
+        for key in self._lookup_keys(item):
+            query_date = self.__storage.query_date(key)
+            if query_date is None:
+                continue
+            age = datetime.datetime.now().timestamp() - query_date
+            if self.__hard_ttl is not None and age >= self.__hard_ttl:
+                return Freshness.EXPIRED
+            return Freshness.STALE if age >= self.__soft_ttl else Freshness.FRESH
+        return Freshness.MISSING
+
+    def is_known_missing(self, item) -> bool:
+        """
+        Whether a search recently found that channels do not provide item, in which case it is not worth searching.
+        """
+        payload = self.__storage.read(self._not_found_key(item))
+        if payload is None:
+            return False
+        query_date = CacheRecord(ujson.loads(decompress(payload))).query_date
+        return query_date is not None and query_date >= datetime.datetime.now().timestamp() - self.__not_found_ttl
 
     def __contains__(self, item):
-        return (self.__cache_dir / f"{item}.json").exists()
+        return any(self.__storage.stamp(key) is not None for key in self._lookup_keys(item))
 
     def __getitem__(self, item):
         return self.get(item)
 
-    def get(self, item):
-        item_path: pathlib.Path = self.__cache_dir / f"{item}.json"
-        if item_path.exists():
-            return ujson.loads(item_path.read_text())
+    def _load(self, item) -> Optional[CacheRecord]:
+        for key in self._lookup_keys(item):
+            stamp = self.__storage.stamp(key)
+            if stamp is None:
+                self.__memo.invalidate(key)
+                continue
+            record = self.__memo.get(key, stamp)
+            if record is None:
+                payload = self.__storage.read(key)
+                if payload is None:
+                    continue
+                record = CacheRecord(ujson.loads(decompress(payload)))
+                self.__memo.put(key, stamp, record)
+                self.__storage.touch(key, datetime.datetime.now().timestamp())
+            return record
         return None
 
+    def get(self, item):
+        record = self._load(item)
+        if record is None:
+            return None
+        # Records are shared through the memo: hand out a shallow copy so callers cannot alter the memoized one.
+        return dict(record.data)
+
+    def builds(self, item) -> Optional[List[BuildRecord]]:
+        record = self._load(item)
+        if record is None:
+            return None
+        return record.builds(item)
 
-def _no_restrict(version):  # noqa
-    return True
+    def build_index(self, item) -> Optional[BuildIndex]:
+        """The builds of item ordered for extraction, built once per decoded entry."""
+        record = self._load(item)
+        if record is None:
+            return None
+        return record.index(item)
 
 
-def _restrict_with(spec, version):
-    return version in spec
+def create_cache(settings: Settings, cache_dir: Optional[pathlib.Path] = None) -> CondaCache:
+    return CondaCache(
+        cache_dir,
+        backend=settings.cache.backend,
+        max_size=settings.cache.max_size,
+        compression=settings.cache.compression,
+        not_found_ttl=settings.cache.not_found_ttl,
+        soft_ttl=settings.cache.soft_ttl,
+        hard_ttl=settings.cache.hard_ttl,
+        channels=settings.search.channels,
+        subdir=settings.search.subdir,
+    )
 
 
 class PackageCacheExtractor:
@@ -97,54 +309,63 @@ class PackageCacheExtractor:
         self.__cache = cache
 
     @staticmethod
-    def _check_conditions_on_pkg_requirements(pkg_requires: Constraints, conditions: Packages):
-        def join_constraint_on_condition(a_condition: Package, a_constraint: Constraint):
-            return a_constraint.pkg_name == a_condition.name
-
-        conditions_are_matched = [False] * len(conditions)
-        for i, condition in enumerate(conditions):
-            # Join constraints given our conditions
-            fix_condition_joiner = functools.partial(join_constraint_on_condition, condition)
-            joined_constraints = list(filter(fix_condition_joiner, pkg_requires))
-            if joined_constraints:
-                conditions_are_matched[i] = any((constraint.ensure(condition) for constraint in joined_constraints))
-            else:
-                # If the current condition has no constraint on current package, consider condition as being ok.
-                conditions_are_matched[i] = True
-        return all(conditions_are_matched)
-
-    def _extract_matching_packages(
-        self, pkg_name: str, conditions: Packages, version_restrict: Callable[[str], bool]
-    ) -> Packages:
-        pkg_info = self.__cache[pkg_name]
-        if not pkg_info or pkg_name not in pkg_info:
-            return []
-
-        all_matching_packages = []
-        for package_desc in pkg_info[pkg_name]:
-            _depends = list(filter(lambda pkg_constraint: " " in pkg_constraint, package_desc["depends"]))
-            depends: Constraints = [Constraint.from_conda_depends(specification) for specification in _depends]
-
-            this_package_version = package_desc["version"]
-            if (conditions and self._check_conditions_on_pkg_requirements(depends, conditions)) or not conditions:
-                this_package = Package(
+    def _check_conditions_on_pkg_requirements(
+        pkg_requires: Dict[str, Constraints], conditions: Dict[str, Packages]
+    ) -> bool:
+        # Only the conditions on packages the build constrains are checked, the others hold.
+        for pkg_name, constraints in pkg_requires.items():
+            for condition in conditions.get(pkg_name, ()):
+                if not any(constraint.ensure(condition) for constraint in constraints):
+                    return False
+        return True
+
+    def _iter_matching_packages(
+        self, pkg_name: str, conditions: Packages, specifier: Optional[Specifier] = None
+    ) -> Iterator[Package]:
+        index = self.__cache.build_index(pkg_name)
+        if not index:
+            return
+
+        conditions_by_name: Dict[str, Packages] = {}
+        for condition in conditions:
+            conditions_by_name.setdefault(condition.name, []).append(condition)
+        for _, build in index.matching(specifier):
+            if self._check_conditions_on_pkg_requirements(build.depends_by_name, conditions_by_name):
+                yield Package(
                     name=pkg_name,
-                    version=this_package_version,
-                    build_number=package_desc["build_number"],
-                    build=package_desc["build"],
+                    version=build.version,
+                    build_number=build.build_number,
+                    build=build.build,
                 )
-                if version_restrict(this_package.parse_version().base_version):
-                    all_matching_packages.append(this_package)
 
-        return sorted(all_matching_packages, reverse=True, key=lambda p: p.compare_key())
+    @staticmethod
+    def _pinned_version_specifier(pkg: Package) -> Optional[Specifier]:
+        if pkg.version is not None:
+            return PinnedPackage.from_specifier(pkg.name, pkg.version, f"=={pkg.version}").specifier
+        return None
+
+    @staticmethod
+    def _version_specifier(pkg: Package) -> Optional[Specifier]:
+        if isinstance(pkg, PinnedPackage):
+            return pkg.specifier
+        return PackageCacheExtractor._pinned_version_specifier(pkg)
+
+    def iter_packages(self, pkg: Package, conditions: Packages) -> Iterator[Package]:
+        """
+        Lazily yields the builds of pkg satisfying conditions, in the order of extract_packages (or
+        extract_pinned_packages for a PinnedPackage): builds are only checked as they are consumed.
+        """
+        return self._iter_matching_packages(pkg.name, conditions, self._version_specifier(pkg))
+
+    def extract_best(self, pkg: Package, conditions: Packages, k: int = 1) -> Packages:
+        """
+        The k first packages extract_packages (or extract_pinned_packages) would give, the remaining builds being
+        left unchecked.
+        """
+        return list(itertools.islice(self.iter_packages(pkg, conditions), k))
 
     def extract_packages(self, pkg: Package, conditions: Packages) -> Packages:
-        restriction = _no_restrict
-        if pkg.version is not None:
-            use_spec = PinnedPackage.from_specifier(pkg.name, pkg.version, f"=={pkg.version}").specifier
-            restriction = functools.partial(_restrict_with, use_spec)
-        return self._extract_matching_packages(pkg.name, conditions, restriction)
+        return list(self._iter_matching_packages(pkg.name, conditions, self._pinned_version_specifier(pkg)))
 
     def extract_pinned_packages(self, pin_pkg: PinnedPackage, conditions: Packages) -> Packages:
-        restriction = functools.partial(_restrict_with, pin_pkg.specifier)
-        return self._extract_matching_packages(pin_pkg.name, conditions, restriction)
+        return list(self._iter_matching_packages(pin_pkg.name, conditions, pin_pkg.specifier))
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import platform
+from typing import Iterable, List, Optional
+
+DEFAULT_CHANNEL_ALIAS = "https://conda.anaconda.org"
+SPECIAL_CHANNELS = ("defaults",)
+
+_SUBDIRS = {
+    ("Linux", "x86_64"): "linux-64",
+    ("Linux", "aarch64"): "linux-aarch64",
+    ("Linux", "ppc64le"): "linux-ppc64le",
+    ("Darwin", "x86_64"): "osx-64",
+    ("Darwin", "arm64"): "osx-arm64",
+    ("Windows", "AMD64"): "win-64",
+    ("Windows", "ARM64"): "win-arm64",
+}
+
+
+def current_subdir() -> str:
+    """
+    The conda platform subdir searches are made against, CONDA_SUBDIR taking precedence like it does for conda.
+    """
+    forced_subdir = os.environ.get("CONDA_SUBDIR")
+    if forced_subdir:
+        return forced_subdir
+    system, machine = platform.system(), platform.machine()
+    return _SUBDIRS.get((system, machine), f"{system.lower()}-{machine.lower()}")
+
+
+def normalize_channel(channel: str) -> str:
+    """
+    Gives the same name to the different spellings of a channel: "conda-forge" and
+    "https://conda.anaconda.org/conda-forge/" are the same channel.
+    """
+    channel = channel.strip().rstrip("/")
+    if channel in SPECIAL_CHANNELS or "://" in channel or channel.startswith("/"):
+        return channel
+    return f"{DEFAULT_CHANNEL_ALIAS}/{channel}"
+
+
+def normalize_channels(channels: Iterable[str]) -> List[str]:
+    return sorted({normalize_channel(channel) for channel in channels})
+
+
+def cache_namespace(channels: Optional[Iterable[str]] = None, subdir: Optional[str] = None) -> str:
+    """
+    Identifies a channel configuration: the platform subdir, followed by a digest of the channel set when channels
+    are given (otherwise searches rely on the channels of the user .condarc).
+    """
+    subdir = subdir or current_subdir()
+    normalized_channels = normalize_channels(channels or [])
+    if not normalized_channels:
+        return subdir
+    digest = hashlib.sha1("\n".join(normalized_channels).encode("utf8")).hexdigest()[:10]
+    return f"{subdir}-{digest}"
@@ -1,8 +1,82 @@
+import abc
 import contextlib
 import json
 import pathlib
+import random
+import re
+import shutil
 import subprocess
-from typing import List, Optional
+import time
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+import ujson
+
+# Seconds a search command may run before it is killed.
+SEARCH_TIMEOUT = 300.0
+# Times a failed search (timeout, crash, network error...) is run again, the first retry waiting about
+# RETRY_BACKOFF seconds and each following one twice as long.
+SEARCH_RETRIES = 2
+RETRY_BACKOFF = 1.0
+
+
+def retry_delay(attempt: int, backoff: float = RETRY_BACKOFF) -> float:
+    # Jittered: searches failing together (e.g. on a network outage) do not retry together.
+    return backoff * 2**attempt * random.uniform(0.5, 1.5)
+
+
+def is_not_found_error(json_data: Dict) -> bool:
+    # Other errors (e.g. network ones) say nothing about the package availability.
+    return "PackagesNotFoundError" in str(json_data.get("exception_name") or json_data.get("error"))
+
+
+def is_failure(output: Optional[str]) -> bool:
+    """
+    Whether a search failed rather than answered: there is no result, or an error other than packages not being
+    found.
+    """
+    if output is None:
+        return True
+    if isinstance(output, str) and '"error"' not in output:
+        # Found packages are not decoded twice.
+        return False
+    try:
+        json_data = ujson.loads(output)
+    except ValueError:
+        return True
+    return "error" in json_data and not is_not_found_error(json_data)
+
+
+def checked_output(output: Optional[str]) -> Optional[str]:
+    """
+    The output of a search when it is a JSON document, None otherwise (e.g. the messages of a crashing command).
+    """
+    if not output:
+        return None
+    try:
+        json_data = ujson.loads(output)
+    except ValueError:
+        return None
+    return output if isinstance(json_data, dict) else None
+
+
+def batch_spec(pkgs: List[str]) -> str:
+    """
+    A match spec whose name is a regex matching each of the given package names exactly: a single search answers
+    for all of them, results being keyed by package name.
+    """
+    return f"^({'|'.join(re.escape(pkg) for pkg in pkgs)})$"
+
+
+def not_found_error(pkgs: List[str]) -> str:
+    """
+    The error document `conda search --json` outputs when none of the searched packages exists.
+    """
+    return ujson.dumps(
+        {
+            "error": f"PackagesNotFoundError: The following packages are not available: {', '.join(pkgs)}",
+            "packages": pkgs,
+        }
+    )
 
 
 class Executable:
@@ -13,9 +87,9 @@ class Executable:
     def name(self) -> str:
         return self.__executable
 
-    def run_in_executor(self, *args) -> str:
+    def run_in_executor(self, *args, timeout: Optional[float] = None) -> str:
         command = list(filter(lambda x: x, [self.name, *args]))
-        return subprocess.check_output(command, stderr=subprocess.DEVNULL).decode("utf8")
+        return subprocess.check_output(command, stderr=subprocess.DEVNULL, timeout=timeout).decode("utf8")
 
 
 class Conda(Executable):
@@ -42,42 +116,166 @@ class Mamba(Executable):
         return None
 
 
-class CondaSearch(Conda):
-    def __init__(self, channels: Optional[List[str]] = None, use_index: bool = False):
-        super(CondaSearch, self).__init__()
+class SearchBackend(abc.ABC):
+    """
+    A way of searching conda channels. Results have the shape of `conda search --json` ones: the records of the
+    matching packages keyed by package name, or an "error" document.
+    """
+
+    def __init__(
+        self,
+        channels: Optional[List[str]] = None,
+        use_index: bool = False,
+        subdir: Optional[str] = None,
+        timeout: Optional[float] = SEARCH_TIMEOUT,
+        retries: int = SEARCH_RETRIES,
+        backoff: float = RETRY_BACKOFF,
+    ):
         self.use_index = use_index
         self.channels = channels or []
+        self.subdir = subdir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
 
+    @property
+    @abc.abstractmethod
+    def name(self) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
     def execute(self, pkg: str) -> Optional[str]:
-        with contextlib.suppress(subprocess.CalledProcessError):
-            channels = [f"-c {channel}" for channel in self.channels]
-            return self.run_in_executor(
-                "search",
-                "--use-index-cache" if self.use_index else "",
-                "--json",
-                *channels,
-                pkg,
-            )
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def execute_many(self, pkgs: List[str]) -> Optional[str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def probe(self) -> Optional[float]:
+        """Seconds the backend takes to start answering, None if it is not available here."""
+        raise NotImplementedError
+
+
+class CommandSearch(Executable, SearchBackend):
+    """
+    Searches by running the search subcommand of a conda compatible executable.
+    """
+
+    def __init__(self, *args, **kwargs):
+        Executable.__init__(self, self.name)
+        SearchBackend.__init__(self, *args, **kwargs)
+
+    def version(self) -> Optional[str]:
+        with contextlib.suppress(subprocess.SubprocessError, OSError):
+            output = self.run_in_executor("--version", timeout=self.timeout)
+            if output:
+                return output.split("\n")[0]
         return None
 
+    def search_args(self, pkg: str) -> List[str]:
+        channels = [arg for channel in self.channels for arg in ("-c", channel)]
+        subdir = ["--subdir", self.subdir] if self.subdir else []
+        return ["search", "--use-index-cache" if self.use_index else "", "--json", *channels, *subdir, pkg]
 
-class MambaSearch(Mamba):
-    def __init__(self, channels: Optional[List[str]] = None, use_index: bool = False):
-        super().__init__()
-        self.use_index = use_index
-        self.channels = channels or []
+    def search_command(self, spec: str) -> List[str]:
+        return [arg for arg in [self.name, *self.search_args(spec)] if arg]
+
+    def parse_output(self, output: str) -> str:
+        """Turns the output of the search command into a `conda search --json` like result."""
+        return output
+
+    def answer(self, output: Optional[str]) -> Optional[str]:
+        """
+        The result of a search command given its output, None when it did not answer. conda reports packages not
+        being found on stdout, exiting with an error status: the output is used whatever the exit status.
+        """
+        if not output:
+            return None
+        try:
+            return checked_output(self.parse_output(output))
+        except ValueError:
+            return None
+
+    def searches(self, pkgs: List[str]) -> Generator[Tuple[float, str], Optional[str], Optional[str]]:
+        """
+        The retry policy of a search of pkgs, whatever runs the search commands. Yields the seconds to wait then the
+        spec to search, is sent the answer of that search, and returns the result: None when no search answered.
+        Failed searches of a single package are retried, failed batches are not: they are searched again one package
+        at a time.
+        """
+        if len(pkgs) > 1:
+            output = yield 0.0, batch_spec(pkgs)
+            return None if is_failure(output) else output
+        output = yield 0.0, pkgs[0]
+        for attempt in range(self.retries):
+            if not is_failure(output):
+                break
+            output = yield retry_delay(attempt, self.backoff), pkgs[0]
+        return None if is_failure(output) else output
+
+    def _execute_once(self, spec: str) -> Optional[str]:
+        try:
+            return self.answer(self.run_in_executor(*self.search_args(spec), timeout=self.timeout))
+        except subprocess.CalledProcessError as e:
+            return self.answer(e.output.decode("utf8") if e.output else None)
+        except (subprocess.TimeoutExpired, OSError):
+            return None
+
+    def _search(self, pkgs: List[str]) -> Optional[str]:
+        searches = self.searches(pkgs)
+        try:
+            delay, spec = next(searches)
+            while True:
+                time.sleep(delay)
+                delay, spec = searches.send(self._execute_once(spec))
+        except StopIteration as stop:
+            return stop.value
 
     def execute(self, pkg: str) -> Optional[str]:
-        with contextlib.suppress(subprocess.CalledProcessError):
-            channels = [f"-c {channel}" for channel in self.channels]
-            return self.run_in_executor(
-                "search",
-                "--use-index-cache" if self.use_index else "",
-                "--json",
-                *channels,
-                pkg,
-            )
-        return None
+        return self._search([pkg])
+
+    def execute_many(self, pkgs: List[str]) -> Optional[str]:
+        return self._search(pkgs)
+
+    def probe(self) -> Optional[float]:
+        if shutil.which(self.name) is None:
+            return None
+        start = time.monotonic()
+        if self.version() is None:
+            return None
+        return time.monotonic() - start
+
+
+class CondaSearch(CommandSearch):
+    name = "conda"
+
+
+class MambaSearch(CommandSearch):
+    name = "mamba"
+
+
+class MicromambaSearch(CommandSearch):
+    """
+    micromamba has no --use-index-cache (it relies on the TTL of its cached indexes instead), names the subdir a
+    platform, and reports matching records as a flat list.
+    """
+
+    name = "micromamba"
+
+    def search_args(self, pkg: str) -> List[str]:
+        channels = [arg for channel in self.channels for arg in ("-c", channel)]
+        platform = ["--platform", self.subdir] if self.subdir else []
+        return ["search", "--json", *channels, *platform, pkg]
+
+    def parse_output(self, output: str) -> str:
+        data = ujson.loads(output)
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for record in data.get("result", {}).get("pkgs", []):
+            result.setdefault(record.get("name"), []).append(record)
+        if not result:
+            return not_found_error([data.get("query", {}).get("query", "")])
+        return ujson.dumps(result)
 
 
 class MambaEnv(Mamba):
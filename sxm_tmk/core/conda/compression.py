@@ -0,0 +1,57 @@
+import gzip
+from typing import Callable, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency, see the zstd extra
+    zstandard = None  # type: ignore
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _gzip_compress(payload: bytes) -> bytes:
+    # A fixed mtime keeps the output of identical payloads identical.
+    return gzip.compress(payload, compresslevel=6, mtime=0)
+
+
+def _zstd_compress(payload: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(payload)
+
+
+def _zstd_decompress(payload: bytes) -> bytes:
+    if zstandard is None:
+        raise ValueError("Cache entry is compressed with zstd, install the zstandard package to read it.")
+    return zstandard.ZstdDecompressor().decompress(payload)
+
+
+COMPRESSIONS: Dict[str, Optional[Callable[[bytes], bytes]]] = {
+    "none": None,
+    "gzip": _gzip_compress,
+    "zstd": _zstd_compress,
+}
+
+
+def check_compression(compression: str) -> str:
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown cache compression "{compression}". Use one of {", ".join(COMPRESSIONS)}.')
+    if compression == "zstd" and zstandard is None:
+        raise ValueError('Cache compression "zstd" requires the zstandard package (pip install sxm-tmk[zstd]).')
+    return compression
+
+
+def compress(payload: bytes, compression: str) -> bytes:
+    compressor = COMPRESSIONS[compression]
+    return compressor(payload) if compressor is not None else payload
+
+
+def decompress(payload: bytes) -> bytes:
+    """
+    Decodes a payload whatever the compression it was written with: entries are recognized by their magic number,
+    plain JSON payloads start with "{" and are returned as is.
+    """
+    if payload.startswith(GZIP_MAGIC):
+        return gzip.decompress(payload)
+    if payload.startswith(ZSTD_MAGIC):
+        return _zstd_decompress(payload)
+    return payload
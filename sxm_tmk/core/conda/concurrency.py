@@ -0,0 +1,78 @@
+import contextlib
+import os
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+
+def load_per_cpu() -> float:
+    """
+    1 minute load average per CPU, 0 where the load average is not available (e.g. windows).
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class AdaptiveConcurrency:
+    """
+    Bounds the number of searches running at once, between 1 and max_jobs.
+    The bound grows by one while searches run about as fast as the fastest one seen and the machine is not
+    overloaded, and is halved when a search gets much slower (the channel server or the local machine saturates).
+    Searches started before a decrease do not decrease the bound again: they ran under the former bound.
+    """
+
+    SLOW_FACTOR = 2.0
+    FAST_FACTOR = 1.5
+    MAX_LOAD_PER_CPU = 1.0
+
+    def __init__(self, max_jobs: int, load: Callable[[], float] = load_per_cpu):
+        self.__max_jobs = max(1, max_jobs)
+        self.__limit = max(1, self.__max_jobs // 2)
+        self.__active = 0
+        self.__peak = 0
+        self.__best_latency: Optional[float] = None
+        self.__last_decrease = float("-inf")
+        self.__load = load
+        self.__condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self.__limit
+
+    @property
+    def peak(self) -> int:
+        """The highest number of searches that ran at once."""
+        return self.__peak
+
+    def acquire(self) -> float:
+        with self.__condition:
+            while self.__active >= self.__limit:
+                self.__condition.wait()
+            self.__active += 1
+            self.__peak = max(self.__peak, self.__active)
+        return time.monotonic()
+
+    def release(self, started: float):
+        now = time.monotonic()
+        latency = now - started
+        with self.__condition:
+            self.__active -= 1
+            if self.__best_latency is None or latency < self.__best_latency:
+                self.__best_latency = latency
+            if latency > self.SLOW_FACTOR * self.__best_latency or self.__load() > self.MAX_LOAD_PER_CPU:
+                if started >= self.__last_decrease and self.__limit > 1:
+                    self.__limit = max(1, self.__limit // 2)
+                    self.__last_decrease = now
+            elif latency <= self.FAST_FACTOR * self.__best_latency and self.__limit < self.__max_jobs:
+                self.__limit += 1
+            self.__condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        started = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(started)
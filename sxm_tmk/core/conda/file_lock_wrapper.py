@@ -1,17 +1,43 @@
 import abc
 import functools
+import os
 import pathlib
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable
 
 from filelock import FileLock
 from filelock import Timeout as CannotAcquireLock
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None  # type: ignore
+
+
+class CannotUpgradeLock(Exception):
+    def __init__(self, path: str):
+        super().__init__(f'Lock "{path}" is held in shared mode and cannot be upgraded to exclusive mode.')
+
+
+@dataclass
+class LockStatistics:
+    acquisitions: int = 0
+    contended: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
 
 class AbstractFileLock(abc.ABC):
     def __init__(self, path: pathlib.Path):
         self._file_path = path
+        self.__stats_lock = threading.Lock()
+        self.__stats: Dict[str, LockStatistics] = {"shared": LockStatistics(), "exclusive": LockStatistics()}
 
     @abc.abstractmethod
-    def acquire(self, timeout: int = -1):
+    def acquire(self, timeout: int = -1, shared: bool = False):
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -22,17 +48,37 @@ class AbstractFileLock(abc.ABC):
     def locked(self) -> bool:
         pass
 
+    def _record_acquisition(self, shared: bool, waited: float, contended: bool):
+        with self.__stats_lock:
+            stats = self.__stats["shared" if shared else "exclusive"]
+            stats.acquisitions += 1
+            stats.contended += int(contended)
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+
+    @property
+    def statistics(self) -> Dict[str, Dict[str, float]]:
+        with self.__stats_lock:
+            return {mode: asdict(stats) for mode, stats in self.__stats.items()}
+
 
 class FSFileLock(AbstractFileLock):
+    """
+    Exclusive only lock, shared acquisitions are exclusive as well.
+    """
+
     def __init__(self, path: pathlib.Path):
         super().__init__(path)
         self.__lock_impl = FileLock(path)
 
-    def acquire(self, timeout: int = -1):
+    def acquire(self, timeout: int = -1, shared: bool = False):
+        start = time.monotonic()
         try:
             self.__lock_impl.acquire(timeout=timeout)
         except TimeoutError:
             raise CannotAcquireLock(self._file_path.as_posix())
+        waited = time.monotonic() - start
+        self._record_acquisition(shared, waited, waited > 0.001)
 
     def release(self) -> None:
         return self.__lock_impl.release()
@@ -41,7 +87,77 @@ class FSFileLock(AbstractFileLock):
         return self.__lock_impl.is_locked
 
 
+class FcntlReadWriteLock(AbstractFileLock):
+    """
+    Reader/writer lock relying on flock: many holders in shared mode or a single one in exclusive mode.
+    Each thread opens its own descriptor so that threads of a process exclude each other the same way processes do.
+    The lock is reentrant per thread, a thread holding it exclusively may acquire it in shared mode too.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, path: pathlib.Path):
+        super().__init__(path)
+        self.__local = threading.local()
+
+    def _try_lock(self, fd: int, operation: int) -> bool:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def acquire(self, timeout: int = -1, shared: bool = False):
+        depth = getattr(self.__local, "depth", 0)
+        if depth:
+            if self.__local.shared and not shared:
+                raise CannotUpgradeLock(self._file_path.as_posix())
+            self.__local.depth = depth + 1
+            return
+
+        fd = os.open(self._file_path.as_posix(), os.O_RDWR | os.O_CREAT, 0o644)
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        start = time.monotonic()
+        try:
+            contended = not self._try_lock(fd, operation)
+            if contended:
+                if timeout is None or timeout < 0:
+                    fcntl.flock(fd, operation)
+                else:
+                    deadline = start + timeout
+                    while not self._try_lock(fd, operation):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise CannotAcquireLock(self._file_path.as_posix())
+                        time.sleep(min(self.POLL_INTERVAL, remaining))
+        except BaseException:
+            os.close(fd)
+            raise
+        self._record_acquisition(shared, time.monotonic() - start, contended)
+        self.__local.fd = fd
+        self.__local.shared = shared
+        self.__local.depth = 1
+
+    def release(self) -> None:
+        depth = getattr(self.__local, "depth", 0)
+        if not depth:
+            return
+        self.__local.depth = depth - 1
+        if depth == 1:
+            fd = self.__local.fd
+            self.__local.fd = None
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    def locked(self) -> bool:
+        return getattr(self.__local, "depth", 0) > 0
+
+
 def create_lock_file(path: pathlib.Path) -> AbstractFileLock:
+    if fcntl is not None:
+        return FcntlReadWriteLock(path)
     return FSFileLock(path)
 
 
@@ -49,17 +165,66 @@ class LockMixin:
     def __init__(self, path):
         self.__lockfile = create_lock_file(path)
 
-    def acquire(self, timeout=-1):
-        self.__lockfile.acquire(timeout)
+    def acquire(self, timeout=-1, shared=False):
+        self.__lockfile.acquire(timeout, shared)
 
     def release(self):
         self.__lockfile.release()
 
+    @property
+    def lock_statistics(self) -> Dict[str, Dict[str, float]]:
+        return self.__lockfile.statistics
+
+
+class StripedLockMixin(LockMixin):
+    """
+    A global lock plus a set of stripe locks keyed by a stable hash of a key (typically a package name).
+    Operations on a key hold the global lock in shared mode and the stripe of the key exclusively: operations on keys
+    of different stripes run in parallel, while holding the global lock exclusively still excludes all of them.
+    """
+
+    def __init__(self, path: pathlib.Path, stripes: int = 16):
+        super().__init__(path)
+        stripes_dir = path.parent / f"{path.name}.stripes"
+        stripes_dir.mkdir(exist_ok=True)
+        self.__stripes = [create_lock_file(stripes_dir / f"{i:02d}.lock") for i in range(stripes)]
+
+    def _stripe(self, key: str) -> AbstractFileLock:
+        # hash() is salted per process, crc32 gives the same stripe to every process.
+        return self.__stripes[zlib.crc32(key.encode("utf8")) % len(self.__stripes)]
+
+    def acquire_stripe(self, key: str, timeout=-1):
+        self.acquire(timeout, shared=True)
+        try:
+            self._stripe(key).acquire(timeout)
+        except BaseException:
+            self.release()
+            raise
+
+    def release_stripe(self, key: str):
+        try:
+            self._stripe(key).release()
+        finally:
+            self.release()
 
-def lock_call(func):
+    @property
+    def lock_statistics(self) -> Dict[str, Dict[str, float]]:
+        statistics = super().lock_statistics
+        striped = LockStatistics()
+        for stripe in self.__stripes:
+            stripe_stats = stripe.statistics["exclusive"]
+            striped.acquisitions += int(stripe_stats["acquisitions"])
+            striped.contended += int(stripe_stats["contended"])
+            striped.total_wait += stripe_stats["total_wait"]
+            striped.max_wait = max(striped.max_wait, stripe_stats["max_wait"])
+        statistics["striped"] = asdict(striped)
+        return statistics
+
+
+def lock_call(func, shared: bool = False):
     @functools.wraps(func)
     def wrapper(lockable_instance, *args, **kw):
-        lockable_instance.acquire()
+        lockable_instance.acquire(shared=shared)
         try:
             return func(lockable_instance, *args, **kw)
         finally:
@@ -68,16 +233,42 @@ def lock_call(func):
     return wrapper
 
 
-def ensure_lock_on_public_interface_call():
+def striped_lock_call(func):
+    @functools.wraps(func)
+    def wrapper(lockable_instance, key, *args, **kw):
+        lockable_instance.acquire_stripe(key)
+        try:
+            return func(lockable_instance, key, *args, **kw)
+        finally:
+            lockable_instance.release_stripe(key)
+
+    return wrapper
+
+
+def ensure_lock_on_public_interface_call(
+    shared: Iterable[str] = (), lock_free: Iterable[str] = (), striped: Iterable[str] = ()
+):
+    """
+    Wraps the public interface of a LockMixin so that each call holds the lock. Methods listed in shared only read
+    and hold the lock in shared mode, methods listed in lock_free do not take it at all. Methods listed in striped
+    (StripedLockMixin only) hold the stripe of their first argument. Any other method holds the lock exclusively.
+    """
+    shared = set(shared)
+    lock_free = set(lock_free)
+    striped = set(striped)
+
     def decorator(cls):
         for name, obj in vars(cls).items():
             ensure_lock_acquired_before_call = False
-            if callable(obj):
+            if callable(obj) and name not in lock_free:
                 ensure_lock_acquired_before_call = True
-                if name.startswith("__"):
+                if name.startswith("_"):
+                    # Private helpers are only called from public methods, which already hold the lock.
                     ensure_lock_acquired_before_call = name in ["__contains__", "__getitem__"]
-            if ensure_lock_acquired_before_call:
-                setattr(cls, name, lock_call(obj))
+            if ensure_lock_acquired_before_call and name in striped:
+                setattr(cls, name, striped_lock_call(obj))
+            elif ensure_lock_acquired_before_call:
+                setattr(cls, name, lock_call(obj, shared=name in shared))
         return cls
 
     return decorator
@@ -0,0 +1,55 @@
+import collections
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class EntryMemo:
+    """
+    Bounded LRU of decoded cache entries. Each entry is remembered along with the storage stamp it was decoded
+    from, a stamp mismatch (the entry was rewritten by someone else) being a miss.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.__max_entries = max_entries
+        self.__entries: "collections.OrderedDict[str, Tuple[Hashable, Any]]" = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key: str, stamp: Hashable) -> Optional[Any]:
+        with self.__lock:
+            try:
+                known_stamp, value = self.__entries[key]
+            except KeyError:
+                self.__misses += 1
+                return None
+            if known_stamp != stamp:
+                del self.__entries[key]
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return value
+
+    def put(self, key: str, stamp: Hashable, value: Any) -> None:
+        if self.__max_entries <= 0:
+            return
+        with self.__lock:
+            self.__entries[key] = (stamp, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.__hits, "misses": self.__misses, "size": len(self.__entries)}
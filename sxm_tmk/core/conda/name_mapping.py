@@ -0,0 +1,99 @@
+import pathlib
+import re
+from typing import Dict, Iterable, Optional, Set
+
+import ujson
+
+SHIPPED_TABLE_PATH: pathlib.Path = pathlib.Path(__file__).parent / "data" / "pypi_to_conda.json"
+TABLE_PATH: pathlib.Path = pathlib.Path.home() / ".sxm_tmk" / "pypi_to_conda.json"
+TABLE_FORMAT = 1
+
+# Affixes conda packages add to the name of the python package they ship, when the bare name is taken.
+PYTHON_AFFIXES = (re.compile(r"^python-(.+)$"), re.compile(r"^(.+)-python$"))
+
+
+def canonicalize_name(name: str) -> str:
+    """
+    PyPI normalized name (PEP 503): "PyYAML", "ruamel_yaml" and "Ruamel.Yaml" are all the same project.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class NameMapping:
+    """
+    Maps PyPI project names to conda package names.
+    The table holds the names that differ between ecosystems. When it also knows every conda package name of the
+    channels (tables built from channel metadata do), names matching none of them are known not to be on conda.
+    """
+
+    def __init__(self, mapping: Dict[str, str], conda_names: Optional[Iterable[str]] = None):
+        self.__mapping = {canonicalize_name(pypi_name): conda_name for pypi_name, conda_name in mapping.items()}
+        self.__conda_names: Optional[Set[str]] = set(conda_names) if conda_names is not None else None
+
+    @property
+    def mapping(self) -> Dict[str, str]:
+        return self.__mapping
+
+    @property
+    def conda_names(self) -> Optional[Set[str]]:
+        return self.__conda_names
+
+    def conda_name(self, pypi_name: str) -> Optional[str]:
+        """
+        The conda name of a PyPI project, None when the project cannot be on conda.
+        """
+        canonical_name = canonicalize_name(pypi_name)
+        try:
+            return self.__mapping[canonical_name]
+        except KeyError:
+            pass
+        if self.__conda_names is None:
+            # conda package names are lower case.
+            return pypi_name.lower()
+        for candidate in (pypi_name.lower(), canonical_name):
+            if candidate in self.__conda_names:
+                return candidate
+        return None
+
+    def dump(self, path: pathlib.Path = TABLE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conda_names = sorted(self.__conda_names) if self.__conda_names is not None else None
+        path.write_text(
+            ujson.dumps({"version": TABLE_FORMAT, "mapping": self.__mapping, "conda_names": conda_names}, indent=2)
+        )
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> "NameMapping":
+        table = ujson.loads(path.read_text())
+        return cls(table.get("mapping") or {}, table.get("conda_names"))
+
+
+def load_name_mapping(path: Optional[pathlib.Path] = None) -> NameMapping:
+    """
+    The table built by `tmk mapping --refresh` when there is one, the table shipped with sxm-tmk otherwise.
+    """
+    path = path or TABLE_PATH
+    return NameMapping.load(path if path.exists() else SHIPPED_TABLE_PATH)
+
+
+def build_name_mapping(conda_names: Iterable[str], overrides: Optional[Dict[str, str]] = None) -> NameMapping:
+    """
+    Builds a table from the package names of conda channels. PyPI names are guessed from conda names (separators,
+    python affixes), then overridden by the known differences (e.g. torch is pytorch) of the shipped table.
+    """
+    names = set(conda_names)
+    mapping: Dict[str, str] = {}
+    for name in sorted(names):
+        canonical_name = canonicalize_name(name)
+        if canonical_name != name and canonical_name not in names:
+            mapping.setdefault(canonical_name, name)
+        for affix in PYTHON_AFFIXES:
+            match = affix.match(name)
+            if match and canonicalize_name(match.group(1)) not in names:
+                mapping.setdefault(canonicalize_name(match.group(1)), name)
+    if overrides is None:
+        overrides = NameMapping.load(SHIPPED_TABLE_PATH).mapping
+    for pypi_name, conda_name in overrides.items():
+        if conda_name in names:
+            mapping[canonicalize_name(pypi_name)] = conda_name
+    return NameMapping(mapping, names)
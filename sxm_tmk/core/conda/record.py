@@ -0,0 +1,210 @@
+import bisect
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from packaging.specifiers import Specifier, SpecifierSet
+from packaging.version import Version
+
+from sxm_tmk.core.custom_types import Constraints
+from sxm_tmk.core.dependency import (
+    InvalidVersion,
+    canonicalize_conda_depends,
+    intern_constraint,
+    parse_conda_version,
+)
+
+# Format 1 is the raw output of `mamba search --json`, format 2 the projected record.
+RECORD_FORMAT = 2
+
+
+@dataclass
+class BuildRecord:
+    """
+    The part of a conda build PackageCacheExtractor relies on.
+    """
+
+    version: str
+    build: str
+    build_number: int
+    depends: Constraints
+    # depends grouped by the package they constrain.
+    depends_by_name: Dict[str, Constraints] = field(default_factory=dict, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.depends and not self.depends_by_name:
+            self.depends_by_name = group_by_name(self.depends)
+
+
+def group_by_name(constraints: Constraints) -> Dict[str, Constraints]:
+    grouped: Dict[str, Constraints] = {}
+    for constraint in constraints:
+        grouped.setdefault(constraint.pkg_name, []).append(constraint)
+    return grouped
+
+
+class BuildIndex:
+    """
+    The builds of a package ordered by Package.compare_key, their versions parsed once.
+    Builds matching a simple specifier (==, >=, <=, >, <, ~=) are found by binary search on their base version, other
+    specifiers being evaluated build by build. Builds whose version cannot be parsed cannot be ordered and are left
+    out.
+    """
+
+    def __init__(self, builds: List[BuildRecord]):
+        entries = []
+        for position, build in enumerate(builds):
+            try:
+                version = parse_conda_version(build.version)
+            except InvalidVersion:
+                continue
+            # Builds sharing a compare key keep their record order, newest first.
+            entries.append((version, build.build_number, -position, build))
+        entries.sort(key=lambda entry: entry[:3])
+        self.__versions: List[Version] = [entry[0] for entry in entries]
+        self.__base_versions: List[Version] = [Version(version.base_version) for version in self.__versions]
+        self.__base_version_strings: List[str] = [version.base_version for version in self.__versions]
+        self.__builds: List[BuildRecord] = [entry[3] for entry in entries]
+
+    def __len__(self):
+        return len(self.__builds)
+
+    def _range(self, specifier: Specifier) -> Optional[Tuple[int, int]]:
+        operator, version = specifier.operator, specifier.version
+        if "*" in version or "+" in version or operator not in ("==", ">=", "<=", ">", "<", "~="):
+            return None
+        bound = Version(version)
+        base_versions = self.__base_versions
+        if operator == "==":
+            return bisect.bisect_left(base_versions, bound), bisect.bisect_right(base_versions, bound)
+        if operator == ">=":
+            return bisect.bisect_left(base_versions, bound), len(base_versions)
+        if operator == ">":
+            return bisect.bisect_right(base_versions, bound), len(base_versions)
+        if operator == "<=":
+            return 0, bisect.bisect_right(base_versions, bound)
+        if operator == "<":
+            return 0, bisect.bisect_left(base_versions, bound)
+        # ~=X.Y.Z is >=X.Y.Z,==X.Y.*, that is below X.(Y+1) for base versions.
+        if bound.epoch or bound.base_version != version or len(bound.release) < 2:
+            return None
+        upper = Version(".".join(map(str, (*bound.release[:-2], bound.release[-2] + 1))))
+        return bisect.bisect_left(base_versions, bound), bisect.bisect_left(base_versions, upper)
+
+    def _bounds(self, specifier: Union[Specifier, SpecifierSet, None]) -> Optional[Tuple[int, int]]:
+        if specifier is None:
+            return 0, len(self.__builds)
+        if isinstance(specifier, SpecifierSet):
+            if len(specifier) != 1:
+                return None
+            specifier = next(iter(specifier))  # type: ignore
+        return self._range(specifier) if isinstance(specifier, Specifier) else None
+
+    def matching(self, specifier: Union[Specifier, SpecifierSet, None] = None) -> Iterator[Tuple[Version, BuildRecord]]:
+        """
+        Yields the builds whose base version matches specifier (all of them if None) with their parsed version,
+        newest first.
+        """
+        bounds = self._bounds(specifier)
+        if bounds is not None:
+            for i in range(bounds[1] - 1, bounds[0] - 1, -1):
+                yield self.__versions[i], self.__builds[i]
+        elif specifier is not None:
+            for i in range(len(self.__builds) - 1, -1, -1):
+                if self.__base_version_strings[i] in specifier:
+                    yield self.__versions[i], self.__builds[i]
+
+
+def _canonicalize_depends(depends: List[str]) -> List[List[str]]:
+    # Depends without version specification do not constrain anything.
+    return [list(canonicalize_conda_depends(depends_on)) for depends_on in depends if " " in depends_on]
+
+
+def _project_builds(builds_desc: List[Dict[str, Any]]) -> Dict[str, list]:
+    depends_groups: List[List[List[str]]] = []
+    depends_index: Dict[Tuple[str, ...], int] = {}
+    builds = []
+    for build_desc in builds_desc:
+        depends = tuple(build_desc.get("depends", []))
+        try:
+            group = depends_index[depends]
+        except KeyError:
+            group = depends_index[depends] = len(depends_groups)
+            depends_groups.append(_canonicalize_depends(list(depends)))
+        builds.append(
+            [build_desc.get("version"), build_desc.get("build", ""), build_desc.get("build_number", 0), group]
+        )
+    return {"builds": builds, "depends": depends_groups}
+
+
+def project_search_result(search_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Projects the result of a search onto the fields used when extracting packages.
+    Each package is stored as:
+     * builds: [version, build, build_number, index of the build depends] tuples
+     * depends: the distinct depends of the builds, canonicalized as [pkg_name, specifier_set] pairs.
+    Builds of a package mostly share the same depends, storing them once is what makes the record compact.
+    """
+    record = {}
+    for pkg_name, builds in search_result.items():
+        if isinstance(builds, list):
+            record[pkg_name] = _project_builds([build for build in builds if isinstance(build, dict)])
+    return record
+
+
+class CacheRecord:
+    """
+    A decoded cache entry. Builds are turned into BuildRecord once, on first access.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.__data = data
+        self.__builds: Dict[str, List[BuildRecord]] = {}
+        self.__indexes: Dict[str, BuildIndex] = {}
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self.__data
+
+    @property
+    def format(self) -> int:
+        return self.__data.get("sxm_tmk", {}).get("format", 1)
+
+    @property
+    def query_date(self) -> Optional[float]:
+        return self.__data.get("sxm_tmk", {}).get("query_date")
+
+    def builds(self, pkg_name: str) -> List[BuildRecord]:
+        try:
+            return self.__builds[pkg_name]
+        except KeyError:
+            pass
+        if self.format < RECORD_FORMAT:
+            projection = _project_builds(self.__data.get(pkg_name) or [])
+        else:
+            projection = self.__data.get(pkg_name) or {}
+        # Builds sharing the same depends share the same constraints, grouped once.
+        depends_groups = [
+            [intern_constraint(pkg, spec) for pkg, spec in depends] for depends in projection.get("depends", [])
+        ]
+        grouped_depends = [group_by_name(depends) for depends in depends_groups]
+        # Builds of a version share its string, as do the packages extracted from them.
+        builds = [
+            BuildRecord(
+                version=sys.intern(version),
+                build=build,
+                build_number=build_number,
+                depends=depends_groups[group],
+                depends_by_name=grouped_depends[group],
+            )
+            for version, build, build_number, group in projection.get("builds", [])
+        ]
+        self.__builds[pkg_name] = builds
+        return builds
+
+    def index(self, pkg_name: str) -> BuildIndex:
+        try:
+            return self.__indexes[pkg_name]
+        except KeyError:
+            index = self.__indexes[pkg_name] = BuildIndex(self.builds(pkg_name))
+            return index
@@ -1,62 +1,363 @@
+import abc
+import atexit
 import enum
-from concurrent.futures import ALL_COMPLETED, ThreadPoolExecutor, wait
-from typing import Dict, List, Optional
+import threading
+import time
+import weakref
+from concurrent.futures import ALL_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import ujson
 
-from sxm_tmk.core.conda.cache import CondaCache
-from sxm_tmk.core.conda.commands import MambaSearch
+from sxm_tmk.core.conda.backends import create_search, resolve_backend
+from sxm_tmk.core.conda.cache import CondaCache, Freshness
+from sxm_tmk.core.conda.commands import (
+    SEARCH_RETRIES,
+    SEARCH_TIMEOUT,
+    SearchBackend,
+    is_not_found_error,
+)
+from sxm_tmk.core.conda.concurrency import AdaptiveConcurrency
 from sxm_tmk.core.custom_types import Packages
 from sxm_tmk.core.out.terminal import Progress
 
+# Package names searched per invocation of the search command, which loads the channel indexes each time.
+BATCH_SIZE = 50
+
+# Seconds pending refreshes are given to complete when the interpreter exits, after which they are abandoned: their
+# entries are served stale and refreshed by the next run. Cache writes being atomic, entries are never left partial.
+EXIT_WAIT = 10.0
+
+SearchMethod = SearchBackend
+
 
 class SearchStatus(enum.Enum):
     FOUND_IN_REPOSITORY = "found"
     FOUND_IN_CACHE = "found"
     NOT_FOUND = "not_found"
+    # The search did not answer (timeout, crash, network error...): nothing is known about the package.
+    FAILED = "failed"
+
 
+SearchResult = Tuple[SearchStatus, str]
 
-def search(method: MambaSearch, pkg: str, cache: CondaCache, progress_task: Progress.Task):
-    if pkg not in cache:
-        data = method.execute(pkg)
-        progress_task.update(1)
-        if data is None:
-            return SearchStatus.NOT_FOUND, pkg
 
-        json_data = ujson.loads(data)
-        if "error" in json_data:
-            return SearchStatus.NOT_FOUND, pkg
+def store_search_result(pkg: str, data: Optional[str], cache: CondaCache) -> SearchStatus:
+    if data is None:
+        return SearchStatus.FAILED
+    json_data = ujson.loads(data)
+    if "error" in json_data:
+        if not is_not_found_error(json_data):
+            return SearchStatus.FAILED
+        cache.store_not_found(pkg)
+        return SearchStatus.NOT_FOUND
+    cache.store(pkg, data)
+    return SearchStatus.FOUND_IN_REPOSITORY
+
+
+def store_batch_result(
+    pkgs: List[str], data: Optional[str], cache: CondaCache, store_not_found: bool = True
+) -> Optional[List[SearchResult]]:
+    """
+    Splits the result of a batched search into one cache entry per package. Packages absent from the result are
+    not found, recorded as such unless store_not_found is False. Returns None when the search failed as a whole,
+    which includes results holding none of the packages.
+    """
+    json_data = ujson.loads(data) if data is not None else None
+    if json_data is None or "error" in json_data or not any(json_data.get(pkg) for pkg in pkgs):
+        return None
+    results = []
+    for pkg in pkgs:
+        if json_data.get(pkg):
+            cache.store(pkg, ujson.dumps({pkg: json_data[pkg]}))
+            results.append((SearchStatus.FOUND_IN_REPOSITORY, pkg))
         else:
-            cache.store(pkg, data)
-        return SearchStatus.FOUND_IN_REPOSITORY, pkg
-    else:
-        progress_task.update(1)
-        return SearchStatus.FOUND_IN_CACHE, pkg
+            if store_not_found:
+                cache.store_not_found(pkg)
+            results.append((SearchStatus.NOT_FOUND, pkg))
+    return results
+
+
+def cached_status(pkg: str, cache: CondaCache) -> Optional[SearchStatus]:
+    # Stale entries are served as is, expired ones are searched again.
+    if cache.freshness(pkg) in (Freshness.FRESH, Freshness.STALE):
+        return SearchStatus.FOUND_IN_CACHE
+    if cache.is_known_missing(pkg):
+        return SearchStatus.NOT_FOUND
+    return None
+
+
+def cached_result(pkg: str, cache: CondaCache, progress_task: Progress.Task) -> Optional[SearchResult]:
+    status = cached_status(pkg, cache)
+    if status is None:
+        return None
+    progress_task.update(1)
+    return status, pkg
+
+
+def split_cached(
+    pkgs: List[str], cache: CondaCache, progress_task: Progress.Task
+) -> Tuple[List[SearchResult], List[str]]:
+    results = []
+    missing = []
+    for pkg in pkgs:
+        result = cached_result(pkg, cache, progress_task)
+        if result is not None:
+            results.append(result)
+        else:
+            missing.append(pkg)
+    return results, missing
+
+
+def claim_search(pkg: str, cache: CondaCache, progress_task: Progress.Task) -> Tuple[Optional[SearchResult], bool]:
+    """
+    One round of single-flight searching: the cached result of pkg if any, else whether pkg got claimed. When someone
+    else, in this process or another one, is searching pkg, their result is waited for rather than running the same
+    search, after which pkg is claimed again: their search may have failed.
+    """
+    result = cached_result(pkg, cache, progress_task)
+    if result is not None:
+        return result, False
+    return None, cache.single_flight.claim(pkg)
+
+
+def claim_batch(
+    pkgs: List[str], cache: CondaCache, progress_task: Progress.Task
+) -> Tuple[List[SearchResult], List[str], List[str]]:
+    """The cached results of pkgs, the packages claimed to be searched, and those someone else is searching."""
+    results, missing = split_cached(pkgs, cache, progress_task)
+    claimed, others = cache.single_flight.claim_many(missing)
+    return results, claimed, others
+
+
+def release_all(pkgs: List[str], cache: CondaCache):
+    for pkg in pkgs:
+        cache.single_flight.release(pkg)
+
+
+def searched_result(pkg: str, data: Optional[str], cache: CondaCache, progress_task: Progress.Task) -> SearchResult:
+    progress_task.update(1)
+    return store_search_result(pkg, data, cache), pkg
+
+
+def searched_batch_results(
+    pkgs: List[str], data: Optional[str], cache: CondaCache, progress_task: Progress.Task
+) -> Optional[List[SearchResult]]:
+    """
+    The results of a batch search, None when the batch failed. The search fails as a whole when none of the packages
+    exists, or when the command does not support regex specs: each package is then searched on its own so that one
+    failure does not hide the others.
+    """
+    results = store_batch_result(pkgs, data, cache)
+    if results is not None:
+        progress_task.update(len(pkgs))
+    return results
+
+
+def _search_claimed(method: SearchMethod, pkg: str, cache: CondaCache, progress_task: Progress.Task) -> SearchResult:
+    return searched_result(pkg, method.execute(pkg), cache, progress_task)
+
+
+def search(method: SearchMethod, pkg: str, cache: CondaCache, progress_task: Progress.Task) -> SearchResult:
+    while True:
+        result, claimed = claim_search(pkg, cache, progress_task)
+        if result is not None:
+            return result
+        if claimed:
+            break
+        cache.single_flight.wait(pkg)
+    try:
+        return _search_claimed(method, pkg, cache, progress_task)
+    finally:
+        cache.single_flight.release(pkg)
+
+
+def search_batch(
+    method: SearchMethod, pkgs: List[str], cache: CondaCache, progress_task: Progress.Task
+) -> List[SearchResult]:
+    """
+    Searches several packages with a single invocation of the search command, each found package being stored as its
+    own cache entry. Packages already being searched by someone else are waited for.
+    """
+    if len(pkgs) == 1:
+        return [search(method, pkgs[0], cache, progress_task)]
+
+    results, claimed, others = claim_batch(pkgs, cache, progress_task)
+    try:
+        if len(claimed) == 1:
+            results.append(_search_claimed(method, claimed[0], cache, progress_task))
+        elif claimed:
+            batch_results = searched_batch_results(claimed, method.execute_many(claimed), cache, progress_task)
+            if batch_results is None:
+                batch_results = [_search_claimed(method, pkg, cache, progress_task) for pkg in claimed]
+            results.extend(batch_results)
+    finally:
+        release_all(claimed, cache)
+    return results + [search(method, pkg, cache, progress_task) for pkg in others]
 
 
-class QueryPlan:
-    def __init__(self, jobs: int = 5, cache: Optional[CondaCache] = None):
-        self.__cache = cache or CondaCache()
-        self.__jobs = jobs
-        self.__stats: Dict[str, List[str]] = {"found": [], "not_found": []}
+def refresh(method: SearchMethod, pkgs: List[str], cache: CondaCache) -> List[SearchResult]:
+    """
+    Searches packages again whatever their cache entries. Packages someone else is searching are skipped, and so are
+    packages whose search fails: their entries are left as they are. Only found packages are stored, the entries of
+    the others are kept: an incomplete answer must not wipe entries still in use.
+    """
+    claimed, _ = cache.single_flight.claim_many(pkgs)
+    try:
+        if not claimed:
+            return []
+        data = method.execute(claimed[0]) if len(claimed) == 1 else method.execute_many(claimed)
+        return store_batch_result(claimed, data, cache, store_not_found=False) or []
+    finally:
+        release_all(claimed, cache)
 
-    def _aggregate_results(self, search_result: SearchStatus, pkg: str):
-        self.__stats[str(search_result.value)].append(pkg)
 
+class Revalidator:
+    """
+    Refreshes stale cache entries from a background thread, while the run goes on with the stale entries.
+    Pending refreshes are waited for at most EXIT_WAIT seconds when the interpreter exits.
+    """
+
+    def __init__(
+        self,
+        cache: CondaCache,
+        backend: str = "mamba",
+        channels: Optional[List[str]] = None,
+        subdir: Optional[str] = None,
+        repodata: Iterable[str] = (),
+        batch_size: int = BATCH_SIZE,
+        timeout: Optional[float] = SEARCH_TIMEOUT,
+        retries: int = SEARCH_RETRIES,
+    ):
+        self.__cache = cache
+        self.__backend = backend
+        self.__channels = channels
+        self.__subdir = subdir
+        self.__repodata = list(repodata)
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__method: Optional[SearchMethod] = None
+        self.__batch_size = batch_size
+        # Refreshes run one at a time, from daemon threads: a hung search must not keep the interpreter from exiting.
+        self.__refresh_lock = threading.Lock()
+        self.__futures: List[Future] = []
+        _revalidators.add(self)
+
+    def _refresh(self, pkgs: List[str]) -> List[SearchResult]:
+        if self.__method is None:
+            # Created on the first refresh, from the background thread: nothing is probed while no entry is stale.
+            self.__method = create_search(
+                self.__backend, self.__channels, self.__subdir, self.__repodata, self.__timeout, self.__retries
+            )
+            # Stale entries being old, the first refresh does not rely on cached channel indexes.
+            self.__method.use_index = False
+        results = []
+        for i in range(0, len(pkgs), self.__batch_size):
+            results.extend(refresh(self.__method, pkgs[i : i + self.__batch_size], self.__cache))
+            self.__method.use_index = True
+        return results
+
+    def _run(self, future: Future, pkgs: List[str]):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with self.__refresh_lock:
+                future.set_result(self._refresh(pkgs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def submit(self, pkgs: List[str]):
+        if pkgs:
+            future: Future = Future()
+            self.__futures.append(future)
+            threading.Thread(target=self._run, args=(future, pkgs), name="tmk-revalidate", daemon=True).start()
+
+    def wait(self, timeout: Optional[float] = None):
+        wait(self.__futures, timeout=timeout, return_when=ALL_COMPLETED)
+
+
+_revalidators: "weakref.WeakSet[Revalidator]" = weakref.WeakSet()
+
+
+@atexit.register
+def _wait_for_revalidators():
+    deadline = time.monotonic() + EXIT_WAIT
+    for revalidator in list(_revalidators):
+        revalidator.wait(max(0.0, deadline - time.monotonic()))
+
+
+class BaseQueryPlan(abc.ABC):
+    """
+    Searches packages, from the cache when possible, and sorts them by search status. Engines differ in the way
+    searches run concurrently.
+    """
+
+    def __init__(
+        self,
+        jobs: int = 5,
+        cache: Optional[CondaCache] = None,
+        channels: Optional[List[str]] = None,
+        subdir: Optional[str] = None,
+        batch_size: int = BATCH_SIZE,
+        backend: str = "mamba",
+        repodata: Iterable[str] = (),
+        timeout: Optional[float] = SEARCH_TIMEOUT,
+        retries: int = SEARCH_RETRIES,
+    ):
+        self.__repodata = list(repodata)
+        self.__backend = backend
+        self.__batch_size = max(batch_size, 1)
+        self.__channels = channels or []
+        self.__subdir = subdir
+        self.__cache = cache or CondaCache(channels=self.__channels, subdir=self.__subdir)
+        self.__jobs = max(1, jobs)
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__stats: Dict[str, List[str]] = {"found": [], "not_found": [], "failed": []}
+        self.__revalidator = Revalidator(
+            self.__cache,
+            self.__backend,
+            self.__channels,
+            subdir,
+            self.__repodata,
+            batch_size=self.__batch_size,
+            timeout=timeout,
+            retries=retries,
+        )
+
+    @property
+    def cache(self) -> CondaCache:
+        return self.__cache
+
+    @property
+    def jobs(self) -> int:
+        return self.__jobs
+
+    @property
+    def revalidator(self) -> Revalidator:
+        return self.__revalidator
+
+    def _create_search(self, use_index: bool) -> SearchMethod:
+        # Resolved on the first search, then kept: a warm run answered from the cache never probes the backends.
+        self.__backend = resolve_backend(self.__backend, self.__repodata)
+        method = create_search(
+            self.__backend, self.__channels, self.__subdir, self.__repodata, self.__timeout, self.__retries
+        )
+        # The first search refreshes the channel indexes, the following ones rely on the refreshed indexes.
+        method.use_index = use_index
+        return method
+
+    def _batches(self, pkgs: List[str]) -> List[List[str]]:
+        return [pkgs[i : i + self.__batch_size] for i in range(0, len(pkgs), self.__batch_size)]
+
+    def _aggregate_results(self, names: List[str], results: Dict[str, SearchStatus]):
+        # Aggregated in the order of the packages, whatever the order searches completed in.
+        for name in names:
+            self.__stats[str(results[name].value)].append(name)
+
+    @abc.abstractmethod
     def search_and_mark(self, packages: Packages, progress_track: Progress.Task):
-        futures = []
-        method = MambaSearch()
-        method.use_index = False
-        self._aggregate_results(*search(method, packages[0].name, self.__cache, progress_track))
-        method.use_index = True
-        with ThreadPoolExecutor(max_workers=10) as tp:
-            method.use_index = True
-            for package in packages[1:]:
-                futures.append(tp.submit(search, method, package.name, self.__cache, progress_track))
-            wait(futures, return_when=ALL_COMPLETED)
-        for result in futures:
-            k, v = result.result()
-            self._aggregate_results(k, v)
+        raise NotImplementedError
 
     @property
     def stats(self):
@@ -69,3 +370,54 @@ class QueryPlan:
     @property
     def not_found_pkgs(self):
         return self.__stats["not_found"]
+
+    @property
+    def failed_pkgs(self):
+        return self.__stats["failed"]
+
+
+class QueryPlan(BaseQueryPlan):
+    def _throttled(self, concurrency: AdaptiveConcurrency, search_function, *args):
+        with concurrency.slot():
+            return search_function(*args)
+
+    def search_and_mark(self, packages: Packages, progress_track: Progress.Task):
+        names = [package.name for package in packages]
+        concurrency = AdaptiveConcurrency(self.jobs)
+        results: Dict[str, SearchStatus] = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as tp:
+            # Cache checks go on while the indexes are refreshed: a warm run never waits on a search.
+            warm_up = None
+            missing = []
+            stale = []
+            for name in names:
+                if self.cache.freshness(name) is Freshness.STALE:
+                    stale.append(name)
+                result = cached_result(name, self.cache, progress_track)
+                if result is not None:
+                    status, _ = result
+                    results[name] = status
+                elif warm_up is None:
+                    warm_up_method = self._create_search(use_index=False)
+                    warm_up = tp.submit(
+                        self._throttled, concurrency, search, warm_up_method, name, self.cache, progress_track
+                    )
+                else:
+                    missing.append(name)
+            self.revalidator.submit(stale)
+            if warm_up is not None:
+                status, pkg = warm_up.result()
+                results[pkg] = status
+
+            futures = []
+            if missing:
+                method = self._create_search(use_index=True)
+                futures = [
+                    tp.submit(self._throttled, concurrency, search_batch, method, batch, self.cache, progress_track)
+                    for batch in self._batches(missing)
+                ]
+                wait(futures, return_when=ALL_COMPLETED)
+        for future in futures:
+            for status, pkg in future.result():
+                results[pkg] = status
+        self._aggregate_results(names, results)
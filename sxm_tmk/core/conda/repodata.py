@@ -0,0 +1,195 @@
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+import ujson
+
+from sxm_tmk.core.conda.channels import current_subdir, normalize_channel
+from sxm_tmk.core.conda.commands import SearchBackend, not_found_error
+
+# Fields of a repodata record kept in the index, the ones a cache entry is projected onto plus where it comes from.
+RECORD_FIELDS = ("name", "version", "build", "build_number", "depends", "subdir")
+
+PackageIndex = Dict[str, List[Dict[str, Any]]]
+
+
+class RepodataIndex:
+    """
+    Package records of a repodata.json file, indexed by package name.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.__path = path
+        self.__packages: PackageIndex = {}
+        self.__channel: Optional[str] = None
+        self.__subdir: Optional[str] = None
+        self._load()
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self.__path
+
+    @property
+    def channel(self) -> Optional[str]:
+        return self.__channel
+
+    @property
+    def subdir(self) -> Optional[str]:
+        return self.__subdir
+
+    def _load(self):
+        content = self.__path.read_bytes()
+        if not content:
+            return
+        repodata = ujson.loads(content)
+        info = repodata.get("info") or {}
+        self.__subdir = info.get("subdir")
+        # conda keeps the url of cached repodata in it, mamba aside in a .state.json file.
+        url = repodata.get("_url") or _state_url(self.__path)
+        if url:
+            self.__channel = _channel_of(url, self.__subdir)
+        for section in ("packages", "packages.conda"):
+            for record in (repodata.get(section) or {}).values():
+                name = record.get("name")
+                if name:
+                    self.__packages.setdefault(name, []).append({field: record.get(field) for field in RECORD_FIELDS})
+
+    def names(self) -> List[str]:
+        return list(self.__packages)
+
+    def search(self, pkg: str) -> List[Dict[str, Any]]:
+        return self.__packages.get(pkg, [])
+
+    def __contains__(self, pkg: str) -> bool:
+        return pkg in self.__packages
+
+
+def _channel_of(url: str, subdir: Optional[str]) -> str:
+    url = url.rstrip("/")
+    for suffix in ("/repodata.json", f"/{subdir}"):
+        if url.endswith(suffix):
+            url = url[: -len(suffix)]
+    return url
+
+
+def _state_url(path: pathlib.Path) -> Optional[str]:
+    for state_path in (path.with_suffix(".state.json"), path.with_suffix(".info.json")):
+        try:
+            return ujson.loads(state_path.read_text()).get("url")
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+_INDEXES: Dict[pathlib.Path, Tuple[Hashable, RepodataIndex]] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def load_index(path: pathlib.Path) -> RepodataIndex:
+    """
+    Indexes a repodata.json file once per process, until the file changes.
+    """
+    st = path.stat()
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _INDEXES_LOCK:
+        known = _INDEXES.get(path)
+        if known is None or known[0] != stamp:
+            known = _INDEXES[path] = (stamp, RepodataIndex(path))
+        return known[1]
+
+
+def pkgs_dirs() -> List[pathlib.Path]:
+    """
+    Package caches of conda and mamba, where they keep the repodata of the channels they searched.
+    """
+    dirs = [pathlib.Path(p) for p in os.environ.get("CONDA_PKGS_DIRS", "").split(",") if p]
+    for root_variable in ("MAMBA_ROOT_PREFIX", "CONDA_ROOT"):
+        root = os.environ.get(root_variable)
+        if root:
+            dirs.append(pathlib.Path(root) / "pkgs")
+    conda_exe = os.environ.get("CONDA_EXE")
+    if conda_exe:
+        dirs.append(pathlib.Path(conda_exe).parent.parent / "pkgs")
+    dirs.append(pathlib.Path.home() / ".conda" / "pkgs")
+    return [d for d in dict.fromkeys(dirs) if d.is_dir()]
+
+
+def find_repodata(paths: Iterable[str] = ()) -> Iterator[pathlib.Path]:
+    """
+    Repodata files to search: the configured ones (a repodata.json file, or a local channel directory holding
+    <subdir>/repodata.json files), otherwise the ones cached by conda and mamba.
+    """
+    configured = [pathlib.Path(p).expanduser() for p in paths]
+    if not configured:
+        for pkgs_dir in pkgs_dirs():
+            yield from sorted(p for p in (pkgs_dir / "cache").glob("*.json") if p.suffixes == [".json"])
+        return
+    for path in configured:
+        if path.is_dir():
+            yield from sorted(path.glob("*/repodata.json"))
+        elif path.exists():
+            yield path
+
+
+class RepodataSearch(SearchBackend):
+    """
+    Answers searches from repodata.json files, in process: no conda/mamba process is started.
+    """
+
+    name = "repodata"
+
+    def __init__(
+        self,
+        channels: Optional[List[str]] = None,
+        use_index: bool = True,
+        subdir: Optional[str] = None,
+        paths: Iterable[str] = (),
+    ):
+        super().__init__(channels=channels, use_index=use_index, subdir=subdir)
+        self.__paths = list(paths)
+
+    def indexes(self) -> List[RepodataIndex]:
+        subdirs = {self.subdir or current_subdir(), "noarch"}
+        channels = {normalize_channel(channel) for channel in self.channels}
+        indexes = []
+        for path in find_repodata(self.__paths):
+            try:
+                index = load_index(path)
+            except (OSError, ValueError):
+                continue
+            if index.subdir is not None and index.subdir not in subdirs:
+                continue
+            if channels and index.channel is not None and normalize_channel(index.channel) not in channels:
+                continue
+            indexes.append(index)
+        return indexes
+
+    def _search(self, pkgs: List[str], indexes: List[RepodataIndex]) -> PackageIndex:
+        result: PackageIndex = {}
+        for index in indexes:
+            for pkg in pkgs:
+                records = index.search(pkg)
+                if records:
+                    result.setdefault(pkg, []).extend(records)
+        return result
+
+    def execute(self, pkg: str) -> Optional[str]:
+        return self.execute_many([pkg])
+
+    def probe(self) -> Optional[float]:
+        start = time.monotonic()
+        if not self.indexes():
+            return None
+        return time.monotonic() - start
+
+    def execute_many(self, pkgs: List[str]) -> Optional[str]:
+        indexes = self.indexes()
+        if not indexes:
+            # Nothing was searched (e.g. misconfigured paths): whether channels provide pkgs is unknown.
+            return None
+        result = self._search(pkgs, indexes)
+        if not result:
+            return not_found_error(pkgs)
+        return ujson.dumps(result)
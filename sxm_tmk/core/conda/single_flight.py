@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import os
+import pathlib
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# A claim of another host older than this is the one of a search that will never complete (e.g. its process was
+# killed). Claims of this host hold as long as their process lives.
+STALE_AFTER = 600.0
+POLL_INTERVAL = 0.1
+
+
+class SingleFlight:
+    """
+    Makes sure a single search of a given package runs at a time, in this process and in the other processes sharing
+    the cache directory. The first caller claims the package and searches it, the others wait for the claim to be
+    released then read the result from the cache.
+    Claims are <key>.inflight files created exclusively in the cache directory, naming the host and the process that
+    holds them, so that claims of dead processes do not block anyone.
+    """
+
+    SUFFIX = ".inflight"
+
+    def __init__(self, directory: pathlib.Path, key: Callable[[str], str] = str, stale_after: float = STALE_AFTER):
+        self.__directory = directory
+        self.__key = key
+        self.__stale_after = stale_after
+        self.__lock = threading.Lock()
+        self.__claims: Dict[str, threading.Event] = {}
+        self.__owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _path(self, pkg: str) -> pathlib.Path:
+        return self.__directory / f"{self.__key(pkg)}{self.SUFFIX}"
+
+    def _is_stale(self, path: pathlib.Path) -> bool:
+        try:
+            age = time.time() - path.stat().st_mtime
+            host, pid = path.read_text().rsplit(":", 1)
+        except OSError:
+            # Vanished.
+            return False
+        except ValueError:
+            # Being written by its owner, or left empty by an owner killed right after creating it.
+            return age > self.__stale_after
+        if host != socket.gethostname() or os.name != "posix":
+            # Whether the owner lives cannot be checked.
+            return age > self.__stale_after
+        # However long its search takes (timeouts and retries), the claim of a live process holds.
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except (OSError, ValueError):
+            return False
+        return False
+
+    def _create_claim(self, path: pathlib.Path) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(path.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                if not self._is_stale(path):
+                    return False
+                with contextlib.suppress(FileNotFoundError):
+                    path.unlink()
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(self.__owner)
+            return True
+        return False
+
+    def claim(self, pkg: str) -> bool:
+        """
+        Claims the search of pkg, True when the caller has to search it and then release it.
+        """
+        with self.__lock:
+            if pkg in self.__claims or not self._create_claim(self._path(pkg)):
+                return False
+            self.__claims[pkg] = threading.Event()
+            return True
+
+    def claim_many(self, pkgs: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Splits pkgs into the claimed ones and the ones searched by someone else.
+        """
+        claimed: List[str] = []
+        others: List[str] = []
+        for pkg in pkgs:
+            (claimed if self.claim(pkg) else others).append(pkg)
+        return claimed, others
+
+    def release(self, pkg: str):
+        with self.__lock:
+            event = self.__claims.pop(pkg, None)
+            if event is None:
+                return
+            with contextlib.suppress(FileNotFoundError):
+                self._path(pkg).unlink()
+        event.set()
+
+    def in_flight(self, pkg: str) -> bool:
+        with self.__lock:
+            if pkg in self.__claims:
+                return True
+        path = self._path(pkg)
+        return path.exists() and not self._is_stale(path)
+
+    def wait(self, pkg: str, timeout: Optional[float] = None):
+        """
+        Waits for the search of pkg to complete, at most timeout seconds (the stale delay by default).
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.__stale_after)
+        with self.__lock:
+            event = self.__claims.get(pkg)
+        if event is not None:
+            event.wait(max(0.0, deadline - time.monotonic()))
+            return
+        while self.in_flight(pkg) and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+
+    async def wait_async(self, pkg: str, timeout: Optional[float] = None):
+        deadline = time.monotonic() + (timeout if timeout is not None else self.__stale_after)
+        while self.in_flight(pkg) and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
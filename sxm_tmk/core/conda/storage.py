@@ -0,0 +1,305 @@
+import abc
+import contextlib
+import datetime
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterator, Optional, Type
+
+import ujson
+
+from sxm_tmk.core.conda.compression import decompress
+from sxm_tmk.core.conda.record import CacheRecord
+
+
+@dataclass
+class EntryInfo:
+    """
+    Metadata of a cache entry, available without decoding its payload.
+    """
+
+    key: str
+    query_date: Optional[float]
+    size: int
+    last_access: Optional[float] = None
+
+
+class CacheStorage(abc.ABC):
+    """
+    Storage backend of the conda query cache. A backend only deals with raw payloads indexed by key, the payload
+    format being owned by CondaCache.
+    """
+
+    def __init__(self, cache_dir: pathlib.Path):
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self) -> pathlib.Path:
+        return self._cache_dir
+
+    @abc.abstractmethod
+    def read(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write(self, key: str, payload: bytes, query_date: float) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def touch(self, key: str, access_date: float) -> None:
+        """Records that an entry has been read."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def stamp(self, key: str) -> Optional[Hashable]:
+        """Cheap token identifying the current version of an entry, None if the entry does not exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def query_date(self, key: str) -> Optional[float]:
+        """When the entry was searched, None if the entry does not exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> int:
+        """Deletes an entry and returns the space claimed, in bytes."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def entries(self) -> Iterator[EntryInfo]:
+        raise NotImplementedError
+
+    def discard_leftovers(self, expiry_time: float) -> int:
+        """Removes what interrupted writes left behind before expiry_time. Returns the space claimed, in bytes."""
+        return 0
+
+
+class JSONDirectoryStorage(CacheStorage):
+    """
+    Historical layout: one <key>.json file per package.
+    The modification time of a file is its query date and its access time the last time we read it, which lets us
+    list entries without opening them.
+    Files are written aside then renamed over the entry: readers see either the previous or the new entry, never a
+    partial one, and do not need to lock the cache.
+    """
+
+    TEMPORARY_SUFFIX = ".tmp"
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self._cache_dir / f"{key}.json"
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, payload: bytes, query_date: float) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, prefix=f".{key}.", suffix=self.TEMPORARY_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates files only their owner can read, entries are readable like any other file.
+            os.chmod(tmp_path, 0o644)
+            os.utime(tmp_path, (query_date, query_date))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+            raise
+        self._fsync_cache_dir()
+
+    def _fsync_cache_dir(self):
+        # Persist the rename itself, not supported everywhere (e.g. windows).
+        with contextlib.suppress(OSError):
+            dir_fd = os.open(self._cache_dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def touch(self, key: str, access_date: float) -> None:
+        # atime is set explicitly: mounts with noatime/relatime do not maintain it for us.
+        pkg_file = self._path(key)
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(pkg_file, ns=(int(access_date * 1e9), pkg_file.stat().st_mtime_ns))
+
+    def stamp(self, key: str) -> Optional[Hashable]:
+        try:
+            st = self._path(key).stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def query_date(self, key: str) -> Optional[float]:
+        try:
+            return self._path(key).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> int:
+        pkg_file = self._path(key)
+        try:
+            size = pkg_file.stat().st_size
+            pkg_file.unlink()
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def entries(self) -> Iterator[EntryInfo]:
+        with os.scandir(self._cache_dir) as it:
+            for dir_entry in it:
+                if not dir_entry.name.endswith(".json") or not dir_entry.is_file():
+                    continue
+                try:
+                    st = dir_entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield EntryInfo(
+                    key=dir_entry.name[: -len(".json")],
+                    query_date=st.st_mtime,
+                    size=st.st_size,
+                    last_access=st.st_atime,
+                )
+
+    def discard_leftovers(self, expiry_time: float) -> int:
+        claimed = 0
+        with os.scandir(self._cache_dir) as it:
+            for dir_entry in it:
+                if not dir_entry.name.endswith(self.TEMPORARY_SUFFIX):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    st = dir_entry.stat()
+                    if st.st_mtime < expiry_time:
+                        os.unlink(dir_entry.path)
+                        claimed += st.st_size
+        return claimed
+
+
+class SQLiteStorage(CacheStorage):
+    """
+    Single file storage, indexed by package name and query date.
+    """
+
+    FILE_NAME = "tmk_cache.sqlite"
+
+    def __init__(self, cache_dir: pathlib.Path):
+        super().__init__(cache_dir)
+        self.__db_path: pathlib.Path = cache_dir / self.FILE_NAME
+        self.__local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, query_date REAL, size INTEGER NOT NULL, payload BLOB NOT NULL, last_access REAL)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if "last_access" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN last_access REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_by_query_date ON entries (query_date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_by_last_access ON entries (last_access)")
+
+    @property
+    def db_path(self) -> pathlib.Path:
+        return self.__db_path
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads, keep one per thread.
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.__db_path.as_posix(), timeout=30)
+            self.__local.conn = conn
+        return conn
+
+    def read(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def write(self, key: str, payload: bytes, query_date: float) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, query_date, size, payload, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, query_date, len(payload), payload, query_date),
+            )
+
+    def exists(self, key: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def touch(self, key: str, access_date: float) -> None:
+        with self._connection() as conn:
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (access_date, key))
+
+    def stamp(self, key: str) -> Optional[Hashable]:
+        row = self._connection().execute("SELECT query_date, size FROM entries WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def query_date(self, key: str) -> Optional[float]:
+        row = self._connection().execute("SELECT query_date FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def delete(self, key: str) -> int:
+        with self._connection() as conn:
+            row = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return 0
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return row[0]
+
+    def entries(self) -> Iterator[EntryInfo]:
+        rows = (
+            self._connection()
+            .execute("SELECT key, query_date, size, last_access FROM entries ORDER BY query_date")
+            .fetchall()
+        )
+        for key, query_date, size, last_access in rows:
+            yield EntryInfo(key=key, query_date=query_date, size=size, last_access=last_access)
+
+
+STORAGE_BACKENDS: Dict[str, Type[CacheStorage]] = {"json": JSONDirectoryStorage, "sqlite": SQLiteStorage}
+
+
+def create_storage(backend: str, cache_dir: pathlib.Path) -> CacheStorage:
+    try:
+        return STORAGE_BACKENDS[backend](cache_dir)
+    except KeyError:
+        raise ValueError(f'Unknown cache backend "{backend}". Use one of {", ".join(STORAGE_BACKENDS)}.')
+
+
+def _migrated_query_date(entry: EntryInfo, payload: bytes) -> float:
+    # Entries without a date are dated from their payload, or from now when it holds none.
+    if entry.query_date is not None:
+        return entry.query_date
+    try:
+        query_date = CacheRecord(ujson.loads(decompress(payload))).query_date
+    except (ValueError, AttributeError):
+        query_date = None
+    return query_date if query_date is not None else datetime.datetime.now().timestamp()
+
+
+def migrate_json_directory(destination: CacheStorage, keep_files: bool = False) -> int:
+    """
+    Imports the <key>.json entries found in the destination cache directory into the destination storage.
+    Returns the number of migrated entries.
+    """
+    source = JSONDirectoryStorage(destination.cache_dir)
+    migrated = 0
+    for entry in list(source.entries()):
+        payload = source.read(entry.key)
+        if payload is None:
+            continue
+        destination.write(entry.key, payload, _migrated_query_date(entry, payload))
+        if not keep_files:
+            source.delete(entry.key)
+        migrated += 1
+    return migrated
@@ -0,0 +1,66 @@
+import pathlib
+import re
+from typing import List, Optional, Union
+
+import yaml
+from pydantic import BaseModel, Field, validator
+
+CONFIG_PATH: pathlib.Path = pathlib.Path.home() / ".sxm_tmk" / "config.yaml"
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*$", re.IGNORECASE)
+
+
+def parse_size(size: Union[str, int, None]) -> Optional[int]:
+    """
+    Converts a human readable size (e.g. "2G", "500MB", "1024") into bytes.
+    """
+    if size is None or isinstance(size, int):
+        return size
+    match = SIZE_PATTERN.match(size)
+    if match is None:
+        raise ValueError(f'Invalid size "{size}". Expected a number optionally followed by K, M, G or T.')
+    value, unit = match.groups()
+    return int(float(value) * SIZE_UNITS[unit.upper()])
+
+
+class CacheSettings(BaseModel):
+    backend: str = "json"
+    max_size: Optional[int] = None
+    compression: str = "none"
+    # Seconds packages not found on conda channels are remembered.
+    not_found_ttl: float = 6 * 3600
+    # Seconds after which entries are refreshed in background (soft), or searched again before being used (hard).
+    soft_ttl: float = 24 * 3600
+    hard_ttl: Optional[float] = 30 * 24 * 3600
+
+    _parse_max_size = validator("max_size", pre=True, allow_reuse=True)(parse_size)
+
+
+class SearchSettings(BaseModel):
+    # conda, mamba, micromamba, repodata, or auto to use the installed one starting the fastest.
+    backend: str = "auto"
+    engine: str = "threads"
+    channels: List[str] = Field(default_factory=list)
+    subdir: Optional[str] = None
+    # repodata.json files or local channel directories read by the repodata backend, conda/mamba caches otherwise.
+    repodata: List[str] = Field(default_factory=list)
+    # Seconds a search may run before it is killed, and times a failed search is run again.
+    timeout: Optional[float] = 300
+    retries: int = 2
+    # Search PyPI projects under their conda name (e.g. torch is pytorch), see `tmk mapping`.
+    name_mapping: bool = True
+
+
+class Settings(BaseModel):
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    search: SearchSettings = Field(default_factory=SearchSettings)
+
+
+def load_settings(path: Optional[pathlib.Path] = None) -> Settings:
+    path = path or CONFIG_PATH
+    if not path.exists():
+        return Settings()
+    with path.open("r") as f:
+        data = yaml.load(f, yaml.SafeLoader) or {}
+    return Settings(**data)
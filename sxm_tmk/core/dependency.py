@@ -1,5 +1,6 @@
+import functools
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import packaging.specifiers
 from packaging.specifiers import Specifier, SpecifierSet
@@ -9,6 +10,11 @@ ALPHA = "abcdefghijklmnopqrstuvwxyz"
 OPERATOR_BOUNDARY = [">=", "<=", "==", "~=", "!="]
 OPERATOR_BOUNDARY_STRICT = ["<", ">", "="]
 
+# Bounds of the parsing memos: the versions, specifiers and depends of the cached packages of a lock file, which
+# extraction parses over and over, are a few thousands distinct strings.
+VERSION_MEMO_SIZE = 16384
+SPECIFIER_MEMO_SIZE = 8192
+
 
 class InvalidVersion(Exception):
     def __init__(self, version):
@@ -30,6 +36,7 @@ class NotComparablePackage(Exception):
         super().__init__(f'Package "{package}" cannot be compared to another package: no version information found.')
 
 
+@functools.lru_cache(maxsize=VERSION_MEMO_SIZE)
 def clean_version(version: str) -> str:
     if any((version.startswith(this_op) for this_op in OPERATOR_BOUNDARY)):
         version = version[2:]
@@ -43,6 +50,18 @@ def clean_version(version: str) -> str:
     return f"{version[:-1]}.{str(index + 1)}"
 
 
+@functools.lru_cache(maxsize=VERSION_MEMO_SIZE)
+def parse_conda_version(version: str) -> Version:
+    """
+    Parses a conda version, once cleaned (see clean_version), into a packaging Version.
+    """
+    parsed = parse(clean_version(version))
+    if not isinstance(parsed, Version):
+        raise InvalidVersion(version)
+    return parsed
+
+
+@functools.lru_cache(maxsize=SPECIFIER_MEMO_SIZE)
 def _canonicalize_specifier(specifier: str):
     if any((specifier.startswith(this_op) for this_op in OPERATOR_BOUNDARY)):
         op = specifier[0:2]
@@ -57,28 +76,63 @@ def _canonicalize_specifier(specifier: str):
     return f"{op}{specifier[len(op):-1]}.{str(index + 1)}"
 
 
+@functools.lru_cache(maxsize=SPECIFIER_MEMO_SIZE)
 def _canonicalize_specifier_set(specifiers: str):
     spec_set = specifiers.split(",")
     return ",".join((_canonicalize_specifier(spec) for spec in spec_set))
 
 
+@functools.lru_cache(maxsize=SPECIFIER_MEMO_SIZE)
+def canonicalize_conda_depends(depends_on: str) -> Tuple[str, str]:
+    """
+    Splits a conda depends entry (e.g. "python >=3.8,<3.9.0a0") into the package name and a specifier set
+    understood by packaging.
+    """
+    depends_on_part = depends_on.split(" ")
+    if len(depends_on_part) < 2:
+        raise InvalidConstraintSpecification(depends_on)
+
+    spec_set = _canonicalize_specifier_set(depends_on_part[1]).split(",")
+    has_operators = [any(spec.startswith(op) for op in ("=", ">", "<")) for spec in spec_set]
+    for i, has_operator in enumerate(has_operators):
+        if not has_operator:
+            spec_set[i] = f"=={spec_set[i]}"
+    return depends_on_part[0], ",".join(spec_set)
+
+
 @dataclass(unsafe_hash=True)
 class Package:
     """
     Basic representation of a requirement. Holds the requirement name.
+    Slotted: extraction creates one per candidate build.
     """
 
+    __slots__ = ("name", "version", "build_number", "build", "_parsed_version")
+
     name: str
     version: Optional[str]
     build_number: Optional[int]
     build: Optional[str]
 
-    def parse_version(self) -> Version:  # type: ignore
-        this_version = clean_version(self.version or "0.0.0")
-        version = parse(this_version)
-        if not isinstance(version, Version):
-            raise InvalidVersion(self.version)
-        return version
+    @classmethod
+    def __get_validators__(cls):
+        # pydantic validates dataclasses through their __dict__, which slotted packages do not have.
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value):
+        if isinstance(value, dict):
+            return cls(**value)
+        if not isinstance(value, cls):
+            raise TypeError(f"{cls.__name__} expected, got {type(value).__name__}")
+        return value
+
+    def parse_version(self) -> Version:
+        # Remembered along with the version it was parsed from, version being assignable.
+        parsed = getattr(self, "_parsed_version", None)
+        if parsed is None or parsed[0] != self.version:
+            parsed = self._parsed_version = (self.version, parse_conda_version(self.version or "0.0.0"))
+        return parsed[1]
 
     def compare_key(self):
         if self.version is not None and self.build_number is not None:
@@ -107,6 +161,8 @@ class PinnedPackage(Package):
     A requirement specification, including also the version specifier.
     """
 
+    __slots__ = ("specifier",)
+
     specifier: Specifier
 
     def __post_init__(self):
@@ -129,6 +185,17 @@ class PinnedPackage(Package):
         return f"{self.name}{self.specifier}"
 
 
+@functools.lru_cache(maxsize=SPECIFIER_MEMO_SIZE)
+def parse_specifier_set(specifiers: str) -> SpecifierSet:
+    """
+    Shared SpecifierSet of a specifier string, not to be modified.
+    """
+    try:
+        return SpecifierSet(specifiers)
+    except packaging.specifiers.InvalidSpecifier:
+        raise InvalidConstraintSpecification(specifiers)
+
+
 class Constraint:
     """
     A global constraint that can be used to ensure a Package is in the valid format or to solve a dependency given
@@ -137,10 +204,7 @@ class Constraint:
 
     def __init__(self, pkg_name: str, constraint_description: str):
         self.__pkg_name: str = pkg_name
-        try:
-            self.__constraint_specifications = SpecifierSet(constraint_description.split(" ")[0])
-        except packaging.specifiers.InvalidSpecifier:
-            raise InvalidConstraintSpecification(constraint_description.split(" ")[0])
+        self.__constraint_specifications = parse_specifier_set(constraint_description.split(" ")[0])
 
     def __repr__(self):
         return f"{self.__pkg_name} | {self.__constraint_specifications}"
@@ -158,15 +222,33 @@ class Constraint:
 
     @classmethod
     def from_conda_depends(cls, depends_on: str):
-        depends_on_part = depends_on.split(" ")
-        if len(depends_on_part) < 2:
-            raise InvalidConstraintSpecification(depends_on)
-
-        depends_on_part[1] = _canonicalize_specifier_set(depends_on_part[1])
-        spec_set = depends_on_part[1].split(",")
-        has_operators = [any(spec.startswith(op) for op in ("=", ">", "<")) for spec in spec_set]
-        for i, has_operator in enumerate(has_operators):
-            if not has_operator:
-                spec_set[i] = f"=={spec_set[i]}"
-
-        return cls(depends_on_part[0], ",".join(spec_set))
+        if cls is Constraint:
+            return intern_constraint(*canonicalize_conda_depends(depends_on))
+        return cls(*canonicalize_conda_depends(depends_on))
+
+
+@functools.lru_cache(maxsize=SPECIFIER_MEMO_SIZE)
+def intern_constraint(pkg_name: str, constraint_description: str) -> Constraint:
+    """
+    The shared Constraint of a package name and specifier set. Constraints are never modified once built.
+    """
+    return Constraint(pkg_name, constraint_description)
+
+
+def parsing_memo_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Hits, misses and size of the parsing memos.
+    """
+    memos = {
+        "clean_version": clean_version,
+        "version": parse_conda_version,
+        "specifier": _canonicalize_specifier,
+        "specifier_set": parse_specifier_set,
+        "conda_depends": canonicalize_conda_depends,
+        "constraint": intern_constraint,
+    }
+    stats = {}
+    for name, memo in memos.items():
+        info = memo.cache_info()
+        stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+    return stats
@@ -0,0 +1,20 @@
+import pathlib
+
+import pytest
+import ujson
+
+from sxm_tmk.core.conda.cache import CondaCache
+
+NUMPY_SEARCH_RESULT = pathlib.Path(__file__).parent.parent / "data" / "cached_result_of_numpy.json"
+
+
+@pytest.fixture()
+def numpy_search_result() -> str:
+    return ujson.dumps(ujson.loads(NUMPY_SEARCH_RESULT.read_text()))
+
+
+@pytest.fixture()
+def numpy_cache(tmp_path, numpy_search_result) -> CondaCache:
+    a_cache = CondaCache(tmp_path / "numpy")
+    a_cache.store("numpy", numpy_search_result)
+    return a_cache
@@ -0,0 +1,52 @@
+import re
+import time
+from typing import Tuple
+
+import mock
+import pytest
+import ujson
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.repo import QueryPlan
+from sxm_tmk.core.dependency import Package
+from sxm_tmk.core.out.terminal import Progress
+
+# Cost of one search command invocation: process start and channel indexes loading dominate.
+INVOCATION_LATENCY = 0.02
+PACKAGES = [Package(f"package-{i}", version="1.0.0", build_number=None, build=None) for i in range(100)]
+
+
+def _mamba_search(*args, **kwargs):
+    time.sleep(INVOCATION_LATENCY)
+    spec = args[-1]
+    names = spec[2:-2].split("|") if spec.startswith("^(") else [spec]
+    return ujson.dumps({re.sub(r"\\(.)", r"\1", name): [{"version": "1.0.0"}] for name in names})
+
+
+def _fetch(cache_dir, batch_size: int) -> Tuple[int, float]:
+    """Invocations of the search command and seconds taken to fetch PACKAGES."""
+    q = QueryPlan(jobs=10, cache=CondaCache(cache_dir), batch_size=batch_size)
+    task = Progress("").add_task("mamba", len(PACKAGES))
+    with mock.patch("sxm_tmk.core.conda.commands.Executable.run_in_executor", side_effect=_mamba_search) as mamba:
+        start = time.perf_counter()
+        q.search_and_mark(PACKAGES, task)
+        elapsed = time.perf_counter() - start
+    assert len(q.found_pkgs) == len(PACKAGES)
+    return mamba.call_count, elapsed
+
+
+def test_batched_search_invocations(tmp_path):
+    one_by_one, _ = _fetch(tmp_path / "one_by_one", batch_size=1)
+    batched, _ = _fetch(tmp_path / "batched", batch_size=50)
+    assert one_by_one == len(PACKAGES)
+    # The warm-up search, then the other packages in batches of 50.
+    assert batched == 1 + 2
+
+
+@pytest.mark.benchmark
+def test_batched_search_fetch_time(tmp_path):
+    invocations, one_by_one = _fetch(tmp_path / "one_by_one", batch_size=1)
+    print(f"\nbatch size 1: {invocations} invocations, {one_by_one:.3f}s")
+    invocations, batched = _fetch(tmp_path / "batched", batch_size=50)
+    print(f"batch size 50: {invocations} invocations, {batched:.3f}s")
+    assert batched < one_by_one
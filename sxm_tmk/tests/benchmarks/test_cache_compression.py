@@ -0,0 +1,47 @@
+import pathlib
+import time
+
+import pytest
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.compression import COMPRESSIONS, zstandard
+
+READS = 50
+COMPRESSED = [compression for compression in COMPRESSIONS if compression != "none"]
+
+
+def _read_latency(cache_dir: pathlib.Path) -> float:
+    # Without memo, each read decodes the entry.
+    a_cache = CondaCache(cache_dir, memo_size=0)
+    start = time.perf_counter()
+    for _ in range(READS):
+        a_cache.get("numpy")
+    return (time.perf_counter() - start) / READS
+
+
+def _store(cache_dir: pathlib.Path, compression: str, numpy_search_result: str) -> int:
+    """Size of the numpy entry on disk."""
+    if compression == "zstd" and zstandard is None:
+        pytest.skip("zstandard is not installed")
+    a_cache = CondaCache(cache_dir, compression=compression)
+    a_cache.store("numpy", numpy_search_result)
+    return (cache_dir / f"numpy@{a_cache.namespace}.json").stat().st_size
+
+
+@pytest.mark.parametrize("compression", COMPRESSED)
+def test_compressed_entries_size(compression, tmp_path, numpy_search_result):
+    plain_size = _store(tmp_path / "none", "none", numpy_search_result)
+    size = _store(tmp_path / compression, compression, numpy_search_result)
+    assert size < plain_size / 2
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("compression", COMPRESSED)
+def test_compressed_entries_read_latency(compression, tmp_path, numpy_search_result):
+    plain_size = _store(tmp_path / "none", "none", numpy_search_result)
+    size = _store(tmp_path / compression, compression, numpy_search_result)
+    print(
+        f"\n{compression}: {size} bytes on disk ({size / plain_size:.0%} of plain), "
+        f"{_read_latency(tmp_path / compression) * 1000:.3f} ms per read "
+        f"(plain: {_read_latency(tmp_path / 'none') * 1000:.3f} ms)"
+    )
@@ -0,0 +1,63 @@
+import functools
+import time
+
+import pytest
+
+from sxm_tmk.core.conda.cache import PackageCacheExtractor
+from sxm_tmk.core.dependency import Package
+
+ROUNDS = 20
+# The profile of the environment, then packages already solved from the lock file: most do not constrain numpy.
+CONDITIONS = [
+    Package(name="python", version="3.8.9", build_number=None, build=None),
+    Package(name="libcxx", version="11.8.2", build_number=None, build=None),
+    Package(name="openssl", version="1.1.1", build_number=None, build=None),
+    *(Package(name=f"solved-{i}", version="1.0.0", build_number=None, build=None) for i in range(100)),
+]
+
+
+def _scan_conditions(pkg_requires, conditions):
+    # Check as it was made before depends were grouped by name: a scan of the depends per condition.
+    def join_constraint_on_condition(a_condition, a_constraint):
+        return a_constraint.pkg_name == a_condition.name
+
+    conditions_are_matched = [False] * len(conditions)
+    for i, condition in enumerate(conditions):
+        joined_constraints = list(filter(functools.partial(join_constraint_on_condition, condition), pkg_requires))
+        if joined_constraints:
+            conditions_are_matched[i] = any((constraint.ensure(condition) for constraint in joined_constraints))
+        else:
+            conditions_are_matched[i] = True
+    return all(conditions_are_matched)
+
+
+def _check_time(check, builds, requires, conditions) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        matched = [build for build in builds if check(requires(build), conditions)]
+    elapsed = time.perf_counter() - start
+    assert matched
+    return elapsed
+
+
+def test_grouped_condition_checks(numpy_cache):
+    builds = numpy_cache.builds("numpy")
+    grouped_check = PackageCacheExtractor._check_conditions_on_pkg_requirements
+    conditions_by_name = {condition.name: [condition] for condition in CONDITIONS}
+    assert [_scan_conditions(build.depends, CONDITIONS) for build in builds] == [
+        grouped_check(build.depends_by_name, conditions_by_name) for build in builds
+    ]
+
+
+@pytest.mark.benchmark
+def test_grouped_condition_checks_time(numpy_cache):
+    builds = numpy_cache.builds("numpy")
+    grouped_check = PackageCacheExtractor._check_conditions_on_pkg_requirements
+    conditions_by_name = {condition.name: [condition] for condition in CONDITIONS}
+    scanned = _check_time(_scan_conditions, builds, lambda build: build.depends, CONDITIONS)
+    grouped = _check_time(grouped_check, builds, lambda build: build.depends_by_name, conditions_by_name)
+    print(
+        f"\n{len(builds)} builds, {len(CONDITIONS)} conditions: {scanned / ROUNDS * 1000:.3f} ms scanning depends, "
+        f"{grouped / ROUNDS * 1000:.3f} ms with depends grouped by name"
+    )
+    assert grouped < scanned
@@ -0,0 +1,60 @@
+import dataclasses
+import tracemalloc
+from typing import Optional
+
+from sxm_tmk.core.conda.cache import PackageCacheExtractor
+from sxm_tmk.core.dependency import Package, PinnedPackage
+
+INSTANCES = 10000
+
+
+@dataclasses.dataclass(unsafe_hash=True)
+class DictPackage:
+    # Package as it was before being slotted.
+    name: str
+    version: Optional[str]
+    build_number: Optional[int]
+    build: Optional[str]
+
+
+def _allocated(factory) -> int:
+    tracemalloc.start()
+    try:
+        instances = [factory(i) for i in range(INSTANCES)]
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(instances) == INSTANCES
+    return allocated
+
+
+def test_packages_have_no_instance_dict():
+    assert not hasattr(Package("numpy", version="1.0.0", build_number=0, build="py38_0"), "__dict__")
+    assert not hasattr(PinnedPackage.from_specifier("numpy", "1.0.0", ">=1.0.0"), "__dict__")
+
+
+def test_package_memory():
+    # Names, versions and builds are shared: only the instances themselves are measured.
+    slotted = _allocated(lambda i: Package("numpy", version="1.0.0", build_number=i, build="py38_0"))
+    with_dict = _allocated(lambda i: DictPackage("numpy", version="1.0.0", build_number=i, build="py38_0"))
+    assert slotted < with_dict
+
+
+def test_extraction_allocations(numpy_cache):
+    pkg_extractor = PackageCacheExtractor(numpy_cache)
+    numpy = Package("numpy", version=None, build_number=None, build=None)
+    conditions = [Package("python", version="3.8.9", build_number=None, build=None)]
+    # Decodes the entry and builds its index, which are kept for the run.
+    pkg_extractor.extract_packages(numpy, conditions)
+
+    tracemalloc.start()
+    try:
+        all_packages = pkg_extractor.extract_packages(numpy, conditions)
+        all_allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.clear_traces()
+        best = pkg_extractor.extract_best(numpy, conditions)
+        best_allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert best == all_packages[:1]
+    assert best_allocated < all_allocated
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+
+import mock
+import pytest
+import ujson
+
+from sxm_tmk.core.conda.async_repo import AsyncQueryPlan, create_query_plan, run_search
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.commands import MambaSearch
+from sxm_tmk.core.conda.repo import QueryPlan
+from sxm_tmk.core.dependency import Package
+from sxm_tmk.core.out.terminal import Progress
+
+FAKE_MAMBA = f"""#!{sys.executable}
+import json
+import pathlib
+import re
+import sys
+import time
+
+spec = sys.argv[-1]
+if spec == "slow":
+    time.sleep(10)
+if spec == "broken":
+    sys.exit(1)
+if spec == "crash":
+    print("critical libmamba Could not open lockfile")
+    sys.exit(1)
+if spec == "flaky":
+    state = pathlib.Path(__file__).with_suffix(".flaky")
+    if not state.exists():
+        state.touch()
+        sys.exit(1)
+names = re.sub(r"\\\\(.)", r"\\1", spec[2:-2]).split("|") if spec.startswith("^(") else [spec]
+found = {{name: [{{"version": "1.0.0"}}] for name in names if name != "thingy"}}
+print(json.dumps(found or {{"error": "PackagesNotFoundError"}}))
+"""
+
+
+@pytest.fixture
+def fake_mamba(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    mamba = bin_dir / "mamba"
+    mamba.write_text(FAKE_MAMBA)
+    mamba.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return mamba
+
+
+def test_run_search(fake_mamba):
+    assert ujson.loads(asyncio.run(run_search(MambaSearch(), ["numpy"]))) == {"numpy": [{"version": "1.0.0"}]}
+    assert set(ujson.loads(asyncio.run(run_search(MambaSearch(), ["numpy", "scipy"])))) == {"numpy", "scipy"}
+    assert asyncio.run(run_search(MambaSearch(retries=0), ["broken"])) is None
+    assert asyncio.run(run_search(MambaSearch(retries=0), ["crash"])) is None
+
+
+def test_run_search_command_not_spawned():
+    with mock.patch("asyncio.create_subprocess_exec", side_effect=FileNotFoundError("mamba")):
+        assert asyncio.run(run_search(MambaSearch(retries=0), ["numpy"])) is None
+
+
+def test_run_search_timeout(fake_mamba):
+    assert asyncio.run(run_search(MambaSearch(timeout=0.5, retries=0), ["slow"])) is None
+
+
+def test_run_search_retries(fake_mamba):
+    assert ujson.loads(asyncio.run(run_search(MambaSearch(backoff=0), ["flaky"]))) == {"flaky": [{"version": "1.0.0"}]}
+
+
+def test_async_query_plan_reports_failures(fake_mamba, tmp_path):
+    a_cache = CondaCache(tmp_path)
+    packages = [Package(name, version="1.0.0", build_number=None, build=None) for name in ("numpy", "broken")]
+    q = AsyncQueryPlan(jobs=2, cache=a_cache, retries=0)
+    q.search_and_mark(packages, Progress("").add_task("mamba", len(packages)))
+    assert q.stats == {"found": ["numpy"], "not_found": [], "failed": ["broken"]}
+    assert q.failed_pkgs == ["broken"]
+    assert not a_cache.is_known_missing("broken")
+
+
+def test_async_query_plan(fake_mamba, tmp_path):
+    a_cache = CondaCache(tmp_path / "cache")
+    a_cache.store("pytest", ujson.dumps({"pytest": [{"version": "4.5.6"}]}))
+    names = ("numpy", "pytest", "scipy", "thingy", "attrs")
+    packages = [Package(name, version="1.0.0", build_number=None, build=None) for name in names]
+    q = AsyncQueryPlan(jobs=2, cache=a_cache, batch_size=2)
+    q.search_and_mark(packages, Progress("").add_task("mamba", len(packages)))
+    assert q.stats == {"found": ["numpy", "pytest", "scipy", "attrs"], "not_found": ["thingy"], "failed": []}
+    assert a_cache.builds("scipy")[0].version == "1.0.0"
+
+
+def test_async_query_plan_probes_backends_on_first_search(fake_mamba, tmp_path):
+    a_cache = CondaCache(tmp_path / "cache")
+    a_cache.store("pytest", ujson.dumps({"pytest": [{"version": "4.5.6"}]}))
+    q = AsyncQueryPlan(cache=a_cache, backend="auto")
+    with mock.patch("sxm_tmk.core.conda.backends.select_backend", return_value="mamba") as mocked_select:
+        q.search_and_mark(
+            [Package("pytest", version="1.0.0", build_number=None, build=None)], Progress("").add_task("", 1)
+        )
+        mocked_select.assert_not_called()
+        q.search_and_mark(
+            [Package("numpy", version="1.0.0", build_number=None, build=None)], Progress("").add_task("", 1)
+        )
+    mocked_select.assert_called_once()
+    assert q.found_pkgs == ["pytest", "numpy"]
+
+
+def test_async_query_plan_bounds_searches_in_flight(tmp_path):
+    in_flight = []
+    peak = []
+
+    async def fake_run_search(method, pkgs):
+        in_flight.append(pkgs)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(pkgs)
+        return None
+
+    packages = [Package(f"package-{i}", version="1.0.0", build_number=None, build=None) for i in range(50)]
+    q = AsyncQueryPlan(jobs=4, cache=CondaCache(tmp_path), batch_size=1)
+    with mock.patch("sxm_tmk.core.conda.async_repo.run_search", side_effect=fake_run_search):
+        q.search_and_mark(packages, Progress("").add_task("mamba", len(packages)))
+    assert max(peak) == 4
+    assert len(q.failed_pkgs) == 50
+
+
+def test_create_query_plan(tmp_path):
+    assert isinstance(create_query_plan("threads", cache=CondaCache(tmp_path)), QueryPlan)
+    assert isinstance(create_query_plan("asyncio", cache=CondaCache(tmp_path)), AsyncQueryPlan)
+    with pytest.raises(ValueError, match='Unknown query engine "gevent"'):
+        create_query_plan("gevent")
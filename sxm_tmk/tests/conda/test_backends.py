@@ -0,0 +1,101 @@
+import pathlib
+import sys
+
+import mock
+import pytest
+import ujson
+
+from sxm_tmk.core.conda.backends import create_search, probe_backend, select_backend
+from sxm_tmk.core.conda.commands import CondaSearch, MambaSearch, MicromambaSearch
+from sxm_tmk.core.conda.repodata import RepodataSearch
+
+CHANNEL = pathlib.Path(__file__).parent.parent / "data" / "channel"
+
+
+@pytest.fixture
+def empty_path(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", bin_dir.as_posix())
+    probe_backend.cache_clear()
+    yield bin_dir
+    probe_backend.cache_clear()
+
+
+@pytest.mark.parametrize(
+    ("backend", "expected"),
+    [("conda", CondaSearch), ("mamba", MambaSearch), ("micromamba", MicromambaSearch), ("repodata", RepodataSearch)],
+)
+def test_create_search(backend, expected):
+    method = create_search(backend, channels=["conda-forge"], subdir="linux-64")
+    assert type(method) is expected
+    assert method.channels == ["conda-forge"]
+    assert method.subdir == "linux-64"
+
+
+def test_micromamba_search_args():
+    method = MicromambaSearch(channels=["conda-forge"], use_index=True, subdir="linux-64")
+    assert method.search_args("numpy") == ["search", "--json", "-c", "conda-forge", "--platform", "linux-64", "numpy"]
+
+
+def test_micromamba_output_grouped_by_name():
+    output = ujson.dumps(
+        {
+            "query": {"query": "^(numpy|scipy)$", "type": "search"},
+            "result": {
+                "msg": "",
+                "pkgs": [
+                    {"name": "numpy", "version": "1.0.0"},
+                    {"name": "scipy", "version": "1.0.0"},
+                    {"name": "numpy", "version": "1.1.0"},
+                ],
+                "status": "OK",
+            },
+        }
+    )
+    result = ujson.loads(MicromambaSearch().parse_output(output))
+    assert [record["version"] for record in result["numpy"]] == ["1.0.0", "1.1.0"]
+    assert len(result["scipy"]) == 1
+
+
+def test_micromamba_output_not_found():
+    output = ujson.dumps({"query": {"query": "thingy"}, "result": {"msg": "", "pkgs": [], "status": "OK"}})
+    result = ujson.loads(MicromambaSearch().parse_output(output))
+    assert "PackagesNotFoundError" in result["error"]
+    assert result["packages"] == ["thingy"]
+
+
+def test_probe_not_installed(empty_path):
+    assert MambaSearch().probe() is None
+
+
+def test_probe_installed(empty_path):
+    micromamba = empty_path / "micromamba"
+    micromamba.write_text(f"#!{sys.executable}\nprint('1.5.0')\n")
+    micromamba.chmod(0o755)
+    latency = MicromambaSearch().probe()
+    assert latency is not None and latency >= 0
+    assert MicromambaSearch().version() == "1.5.0"
+
+
+def test_probe_repodata():
+    assert RepodataSearch(subdir="linux-64", paths=[CHANNEL.as_posix()]).probe() is not None
+    assert RepodataSearch(subdir="linux-64", paths=[(CHANNEL / "missing").as_posix()]).probe() is None
+
+
+def test_select_fastest_backend():
+    latencies = {"conda": 0.9, "mamba": 0.4, "micromamba": 0.02, "repodata": None}
+    with mock.patch(
+        "sxm_tmk.core.conda.backends.probe_backend", side_effect=lambda backend, _: latencies[backend]
+    ) as probe:
+        assert select_backend() == "micromamba"
+    # repodata is only a candidate when repodata files are configured.
+    assert sorted(call.args[0] for call in probe.call_args_list) == ["conda", "mamba", "micromamba"]
+
+
+def test_select_configured_repodata():
+    assert select_backend([CHANNEL.as_posix()]) == "repodata"
+
+
+def test_select_fallback(empty_path):
+    assert select_backend() == "mamba"
@@ -1,13 +1,21 @@
 import datetime
+import os
 import subprocess
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 import mock.mock
 import pytest
 import ujson
 
-from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.cache import HARD_TTL, CondaCache, Freshness, create_cache
+from sxm_tmk.core.config import CacheSettings, Settings
+
+SOMETHING_1_0_0 = ujson.dumps(
+    {"something": [{"version": "1.0.0", "build": "h0_0", "build_number": 0, "depends": ["python >=3.8"]}]}
+)
 
 
 @mock.patch("sxm_tmk.core.conda.file_lock_wrapper.create_lock_file")
@@ -19,36 +27,53 @@ def test_ensure_condacache_do_not_lock_upon_init(create_lock_file_mock, tmp_path
 
 
 @mock.patch("sxm_tmk.core.conda.file_lock_wrapper.create_lock_file")
-def test_ensure_locked_call_for_method_contains(create_lock_file_mock, tmp_path):
+def test_ensure_lock_free_call_for_method_contains(create_lock_file_mock, tmp_path):
     create_lock_file_mock.return_value = mock.MagicMock()
     a_cache: CondaCache = CondaCache(tmp_path)
     _ = "something" in a_cache
-    create_lock_file_mock.return_value.acquire.assert_called_once()
-    create_lock_file_mock.return_value.release.assert_called_once()
+    create_lock_file_mock.return_value.acquire.assert_not_called()
+    create_lock_file_mock.return_value.release.assert_not_called()
 
     create_lock_file_mock.return_value = mock.MagicMock()
     a_cache: CondaCache = CondaCache(tmp_path)
     _ = "something" not in a_cache
-    create_lock_file_mock.return_value.acquire.assert_called_once()
-    create_lock_file_mock.return_value.release.assert_called_once()
+    create_lock_file_mock.return_value.acquire.assert_not_called()
+    create_lock_file_mock.return_value.release.assert_not_called()
 
 
 @mock.patch("sxm_tmk.core.conda.file_lock_wrapper.create_lock_file")
-def test_ensure_locked_call_for_method_store(create_lock_file_mock, tmp_path):
-    create_lock_file_mock.return_value = mock.MagicMock()
-    CondaCache(tmp_path).store(
-        "something",
-        ujson.dumps(
-            {
-                "stuff": {
-                    "pkg_name": "something",
-                    "version": "1.0.0",
-                },
-            }
-        ),
-    )
-    create_lock_file_mock.return_value.acquire.assert_called_once()
-    create_lock_file_mock.return_value.release.assert_called_once()
+def test_ensure_striped_call_for_method_store(create_lock_file_mock, tmp_path):
+    locks = {}
+    create_lock_file_mock.side_effect = lambda path: locks.setdefault(path.name, mock.MagicMock())
+    CondaCache(tmp_path).store("something", SOMETHING_1_0_0)
+    locks["tmk.lock"].acquire.assert_called_once_with(-1, True)
+    locks["tmk.lock"].release.assert_called_once()
+    acquired_stripes = [name for name, lock in locks.items() if name != "tmk.lock" and lock.acquire.called]
+    assert len(locks) == 17
+    assert len(acquired_stripes) == 1
+    locks[acquired_stripes[0]].acquire.assert_called_once_with(-1)
+    locks[acquired_stripes[0]].release.assert_called_once()
+
+
+def test_stores_of_different_stripes_do_not_contend(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    another_cache: CondaCache = CondaCache(tmp_path)
+    assert a_cache._stripe("numpy") is not a_cache._stripe("requests")
+
+    a_cache.acquire_stripe("numpy")
+    try:
+        with ThreadPoolExecutor(max_workers=1) as tp:
+            tp.submit(another_cache.store, "requests", SOMETHING_1_0_0).result(timeout=5)
+            blocked_store = tp.submit(another_cache.store, "numpy", SOMETHING_1_0_0)
+            with pytest.raises(FutureTimeoutError):
+                blocked_store.result(timeout=0.5)
+            a_cache.release_stripe("numpy")
+            blocked_store.result(timeout=5)
+    finally:
+        if a_cache._stripe("numpy").locked():
+            a_cache.release_stripe("numpy")
+    assert "requests" in a_cache
+    assert "numpy" in a_cache
 
 
 @mock.patch("sxm_tmk.core.conda.file_lock_wrapper.create_lock_file")
@@ -60,11 +85,11 @@ def test_ensure_locked_call_for_method_clean(create_lock_file_mock, tmp_path):
 
 
 @mock.patch("sxm_tmk.core.conda.file_lock_wrapper.create_lock_file")
-def test_ensure_locked_call_for_method_get(create_lock_file_mock, tmp_path):
+def test_ensure_lock_free_call_for_method_get(create_lock_file_mock, tmp_path):
     create_lock_file_mock.return_value = mock.MagicMock()
     CondaCache(tmp_path).get("something")
-    create_lock_file_mock.return_value.acquire.assert_called_once()
-    create_lock_file_mock.return_value.release.assert_called_once()
+    create_lock_file_mock.return_value.acquire.assert_not_called()
+    create_lock_file_mock.return_value.release.assert_not_called()
 
 
 def test_cache(tmp_path):
@@ -74,10 +99,16 @@ def test_cache(tmp_path):
         "something",
         ujson.dumps(
             {
-                "stuff": {
-                    "pkg_name": "something",
-                    "version": "1.0.0",
-                },
+                "something": [
+                    {
+                        "build": "py38h0_1",
+                        "build_number": 1,
+                        "depends": ["python >=3.8,<3.9.0a0", "python_abi 3.8.* *_cp38", "openssl"],
+                        "md5": "3b010d35f48cd0a47d9919bf852f6404",
+                        "name": "something",
+                        "version": "1.0.0",
+                    }
+                ],
             }
         ),
     )
@@ -87,29 +118,73 @@ def test_cache(tmp_path):
     assert "query_date" in value["sxm_tmk"]
     del value["sxm_tmk"]
     assert value == {
-        "stuff": {
-            "pkg_name": "something",
-            "version": "1.0.0",
+        "something": {
+            "builds": [["1.0.0", "py38h0_1", 1, 0]],
+            "depends": [[["python", ">=3.8,<3.9.0a0"], ["python_abi", "==3.8.*"]]],
         }
     }
 
 
+def test_cache_builds(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    assert a_cache.builds("something") is None
+    a_cache.store("something", SOMETHING_1_0_0)
+    (build,) = a_cache.builds("something")
+    assert (build.version, build.build, build.build_number) == ("1.0.0", "h0_0", 0)
+    assert [constraint.pkg_name for constraint in build.depends] == ["python"]
+    assert a_cache.builds("something") is a_cache.builds("something")
+
+
+def test_cache_builds_from_raw_search_result(cache_with_numpy):
+    a_cache: CondaCache = CondaCache(cache_with_numpy)
+    builds = a_cache.builds("numpy")
+    assert len(builds) == 92
+    assert [constraint.pkg_name for constraint in builds[0].depends] == [
+        "libblas",
+        "libcblas",
+        "liblapack",
+        "python",
+        "python_abi",
+    ]
+
+
+def test_cache_record_is_compact(cache_with_numpy, tmp_path):
+    raw_result = ujson.dumps(ujson.loads((cache_with_numpy / "numpy.json").read_text()))
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("numpy", raw_result)
+    assert _entry_path(a_cache, tmp_path, "numpy").stat().st_size < len(raw_result) / 10
+    assert len(a_cache.builds("numpy")) == 92
+
+
 @mock.patch("sxm_tmk.core.conda.cache.compute_expiry_time", return_value=datetime.datetime.now().timestamp() + 100)
 def test_cache_expiry(mock_expiry_time, tmp_path):
     a_cache: CondaCache = CondaCache(tmp_path)
-    a_cache.store("something", ujson.dumps({"stuff": {"pkg_name": "something", "version": "1.0.0"}}))
+    a_cache.store("something", SOMETHING_1_0_0)
     assert "something" in a_cache
     mock_expiry_time.assert_not_called()
     result = a_cache.clean()
-    mock_expiry_time.assert_called_once_with(False)
+    mock_expiry_time.assert_any_call(False, HARD_TTL)
     assert "something" not in a_cache
     assert result["deleted"] == 1
-    assert 90 < result["space-claimed"] < 100
+    assert 120 < result["space-claimed"] < 180
+
+
+def test_cache_clean_keeps_entries_younger_than_hard_ttl(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, soft_ttl=100, hard_ttl=1000)
+    now = datetime.datetime.now().timestamp()
+    for pkg, age in (("something", 500), ("thingy", 2000)):
+        with mock.patch("sxm_tmk.core.conda.cache.datetime") as mocked_datetime:
+            mocked_datetime.datetime.now.return_value = datetime.datetime.fromtimestamp(now - age)
+            a_cache.store(pkg, SOMETHING_1_0_0.replace("something", pkg))
+    result = a_cache.clean()
+    assert result["deleted"] == 1
+    assert "something" in a_cache
+    assert "thingy" not in a_cache
 
 
 def test_cache_expiry_force_now(tmp_path):
     a_cache: CondaCache = CondaCache(tmp_path)
-    a_cache.store("something", ujson.dumps({"stuff": {"pkg_name": "something", "version": "1.0.0"}}))
+    a_cache.store("something", SOMETHING_1_0_0)
     assert "something" in a_cache
     result = a_cache.clean()
     assert result["deleted"] == 0
@@ -118,7 +193,7 @@ def test_cache_expiry_force_now(tmp_path):
     result = a_cache.clean(now=True)
     assert "something" not in a_cache
     assert result["deleted"] == 1
-    assert 90 < result["space-claimed"] < 100
+    assert 120 < result["space-claimed"] < 180
 
 
 def test_cache_lock(tmp_path):
@@ -149,3 +224,209 @@ if __name__ == "__main__":
     assert process.returncode == 0
     assert "something" in a_cache
     assert now < a_cache.get("something")["sxm_tmk"]["query_date"]
+
+
+def test_cache_memoizes_parsed_entries(cache_with_numpy):
+    a_cache: CondaCache = CondaCache(cache_with_numpy)
+    with mock.patch("sxm_tmk.core.conda.cache.ujson.loads", wraps=ujson.loads) as loads_mock:
+        first = a_cache["numpy"]
+        second = a_cache["numpy"]
+    assert loads_mock.call_count == 1
+    assert first == second
+    assert a_cache.memo_stats == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_cache_memo_returns_copies(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("something", SOMETHING_1_0_0)
+    value = a_cache.get("something")
+    del value["sxm_tmk"]
+    assert "sxm_tmk" in a_cache.get("something")
+
+
+def test_cache_memo_invalidated_on_store_and_clean(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("something", SOMETHING_1_0_0)
+    assert a_cache.builds("something")[0].version == "1.0.0"
+    a_cache.store("something", SOMETHING_1_0_0.replace("1.0.0", "2.0.0"))
+    assert a_cache.builds("something")[0].version == "2.0.0"
+    a_cache.clean(now=True)
+    assert a_cache.get("something") is None
+    assert a_cache.memo_stats["size"] == 0
+
+
+def test_cache_memo_invalidated_by_other_writer(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    another_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("something", SOMETHING_1_0_0)
+    assert a_cache.builds("something")[0].version == "1.0.0"
+    another_cache.store("something", SOMETHING_1_0_0.replace("1.0.0", "2.0.0"))
+    assert a_cache.builds("something")[0].version == "2.0.0"
+
+
+def test_cache_memo_is_bounded(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, memo_size=2)
+    for pkg in ("a", "b", "c"):
+        a_cache.store(pkg, ujson.dumps({pkg: []}))
+        a_cache.get(pkg)
+    assert a_cache.memo_stats["size"] == 2
+
+
+def test_cache_clean_does_not_decode_payloads(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("something", SOMETHING_1_0_0)
+    (tmp_path / "broken.json").write_text("{not json")
+    with mock.patch("sxm_tmk.core.conda.cache.ujson.loads") as loads_mock, mock.patch(
+        "pathlib.Path.read_bytes"
+    ) as read_mock:
+        result = a_cache.clean(now=True)
+    loads_mock.assert_not_called()
+    read_mock.assert_not_called()
+    assert result["deleted"] == 2
+    assert not list(tmp_path.glob("*.json"))
+
+
+def test_cache_read_while_locked(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("something", SOMETHING_1_0_0)
+    a_cache.acquire(-1)
+    try:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import pathlib, sys;"
+                "from sxm_tmk.core.conda.cache import CondaCache;"
+                f"cache = CondaCache(pathlib.Path('{tmp_path.as_posix()}'));"
+                "sys.exit(0 if 'something' in cache and cache.builds('something') else 1)",
+            ]
+        )
+        process.communicate(timeout=10)
+    finally:
+        a_cache.release()
+    assert process.returncode == 0
+
+
+def test_cache_store_is_atomic(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("something", SOMETHING_1_0_0)
+    with mock.patch("sxm_tmk.core.conda.storage.os.replace", side_effect=OSError("disk full")):
+        with pytest.raises(OSError, match="disk full"):
+            a_cache.store("something", SOMETHING_1_0_0.replace("1.0.0", "2.0.0"))
+    assert a_cache.builds("something")[0].version == "1.0.0"
+    assert [p.name for p in tmp_path.iterdir() if p.is_file() and p.name != "tmk.lock"] == [
+        _entry_path(a_cache, tmp_path, "something").name
+    ]
+
+
+def test_cache_clean_discards_interrupted_writes(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    leftover = tmp_path / ".something.x1y2z3.tmp"
+    leftover.write_bytes(b"{partial")
+    assert a_cache.clean()["space-claimed"] == 0
+    assert leftover.exists()
+    result = a_cache.clean(now=True)
+    assert not leftover.exists()
+    assert result == {"deleted": 0, "not-found-deleted": 0, "space-claimed": 8}
+
+
+def _entry_path(a_cache, cache_dir, pkg):
+    return cache_dir / f"{pkg}@{a_cache.namespace}.json"
+
+
+def _store_accessed_at(a_cache, cache_dir, pkg, access_date):
+    a_cache.store(pkg, SOMETHING_1_0_0.replace("something", pkg))
+    pkg_file = _entry_path(a_cache, cache_dir, pkg)
+    os.utime(pkg_file, (access_date, pkg_file.stat().st_mtime))
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    now = datetime.datetime.now().timestamp()
+    for i, pkg in enumerate(("a", "b", "c")):
+        _store_accessed_at(a_cache, tmp_path, pkg, now - 100 + i)
+    a_file = _entry_path(a_cache, tmp_path, "a")
+    entry_size = a_file.stat().st_size
+
+    os.utime(a_file, (now, a_file.stat().st_mtime))
+    result = a_cache.evict(2 * entry_size)
+    assert result["deleted"] == 2
+    assert result["size"] == a_file.stat().st_size
+    assert "a" in a_cache
+    assert "b" not in a_cache
+    assert "c" not in a_cache
+
+
+def test_cache_reads_record_last_access(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    _store_accessed_at(a_cache, tmp_path, "a", 1000.0)
+    a_cache.builds("a")
+    assert _entry_path(a_cache, tmp_path, "a").stat().st_atime > 1000.0
+
+
+def test_cache_store_keeps_cache_within_budget(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("a", SOMETHING_1_0_0.replace("something", "a"))
+    entry_size = _entry_path(a_cache, tmp_path, "a").stat().st_size
+
+    bounded_cache: CondaCache = CondaCache(tmp_path, max_size=3 * entry_size)
+    for pkg in ("b", "c", "d", "e"):
+        bounded_cache.store(pkg, SOMETHING_1_0_0.replace("something", pkg))
+        assert sum(p.stat().st_size for p in tmp_path.glob("*.json")) <= 3 * entry_size
+    assert "e" in bounded_cache
+    assert "a" not in bounded_cache
+
+
+def test_create_cache_from_settings(tmp_path):
+    a_cache: CondaCache = create_cache(Settings(cache=CacheSettings(backend="sqlite", max_size="1K")), tmp_path)
+    a_cache.store("a", SOMETHING_1_0_0.replace("something", "a"))
+    assert (tmp_path / "tmk_cache.sqlite").exists()
+
+
+def test_cache_remembers_packages_not_found(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, not_found_ttl=100)
+    a_cache.store_not_found("thingy")
+    assert a_cache.is_known_missing("thingy")
+    assert "thingy" not in a_cache
+    assert not a_cache.is_known_missing("numpy")
+
+    a_cache.store("thingy", SOMETHING_1_0_0.replace("something", "thingy"))
+    assert not a_cache.is_known_missing("thingy")
+    assert "thingy" in a_cache
+
+    assert a_cache.builds("thingy")
+    a_cache.store_not_found("thingy")
+    assert a_cache.is_known_missing("thingy")
+    assert "thingy" not in a_cache
+    assert a_cache.builds("thingy") is None
+
+
+def test_cache_not_found_entries_expire_sooner(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, not_found_ttl=100)
+    a_cache.store("something", SOMETHING_1_0_0)
+    a_cache.store_not_found("thingy")
+    not_found_file = tmp_path / f"thingy@{a_cache.namespace}.not-found.json"
+    query_date = datetime.datetime.now().timestamp() - 200
+    not_found_file.write_text(ujson.dumps({"sxm_tmk": {"query_date": query_date}}))
+    os.utime(not_found_file, (query_date, query_date))
+
+    assert not a_cache.is_known_missing("thingy")
+    result = a_cache.clean()
+    assert result["deleted"] == 0
+    assert result["not-found-deleted"] == 1
+    assert "something" in a_cache
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_cache_entries_freshness(backend, tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, backend=backend, soft_ttl=100, hard_ttl=1000)
+    assert a_cache.freshness("something") == Freshness.MISSING
+    with mock.patch("sxm_tmk.core.conda.cache.datetime") as mocked_datetime:
+        now = datetime.datetime.now()
+        mocked_datetime.datetime.now.return_value = now
+        a_cache.store("something", SOMETHING_1_0_0)
+        assert a_cache.freshness("something") == Freshness.FRESH
+        mocked_datetime.datetime.now.return_value = now + datetime.timedelta(seconds=200)
+        assert a_cache.freshness("something") == Freshness.STALE
+        mocked_datetime.datetime.now.return_value = now + datetime.timedelta(seconds=2000)
+        assert a_cache.freshness("something") == Freshness.EXPIRED
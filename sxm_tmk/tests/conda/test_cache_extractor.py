@@ -1,6 +1,10 @@
+import mock
+import pytest
+from packaging.specifiers import Specifier
+
 from sxm_tmk.core.conda.cache import CondaCache, PackageCacheExtractor
 from sxm_tmk.core.custom_types import Packages
-from sxm_tmk.core.dependency import Package, PinnedPackage
+from sxm_tmk.core.dependency import Package, PinnedPackage, parse_conda_version
 
 
 def test_cache_extractor_without_conditions(cache_with_numpy, numpy_package):
@@ -74,3 +78,60 @@ def test_cache_extractor_unknown_package(tmp_path, numpy_package):
 
     assert not pkg_extractor.extract_pinned_packages(numpy_pin_at_1_19_5, [])
     assert not pkg_extractor.extract_packages(numpy_package, [])
+
+
+@pytest.mark.parametrize(
+    "specifier",
+    ["==1.19.5", "==1.20", ">=1.20", ">1.19.5", "<=1.21.1", "<1.22", "~=1.21.2", "~=1.21", "!=1.19.5", "==1.21.*"],
+)
+def test_build_index_matches_like_specifier(cache_with_numpy, specifier):
+    a_cache = CondaCache(cache_dir=cache_with_numpy)
+    spec = Specifier(specifier)
+    expected = sorted(
+        (
+            (build.version, build.build_number, build.build)
+            for build in a_cache.builds("numpy")
+            if parse_conda_version(build.version).base_version in spec
+        ),
+        key=lambda b: (parse_conda_version(b[0]), b[1]),
+        reverse=True,
+    )
+    matching = [
+        (build.version, build.build_number, build.build) for _, build in a_cache.build_index("numpy").matching(spec)
+    ]
+    assert matching == expected
+    assert matching
+
+
+def test_build_index_is_built_once(cache_with_numpy):
+    a_cache = CondaCache(cache_dir=cache_with_numpy)
+    assert a_cache.build_index("numpy") is a_cache.build_index("numpy")
+    assert len(a_cache.build_index("numpy")) == len(a_cache.builds("numpy"))
+    assert a_cache.build_index("scipy") is None
+
+
+def test_extract_best_is_the_head_of_extract_packages(cache_with_numpy, numpy_package):
+    pkg_extractor = PackageCacheExtractor(CondaCache(cache_dir=cache_with_numpy))
+    conditions: Packages = [Package(name="python", version="3.8.9", build_number=None, build=None)]
+    all_packages = pkg_extractor.extract_packages(numpy_package, conditions)
+    assert pkg_extractor.extract_best(numpy_package, conditions) == all_packages[:1]
+    assert pkg_extractor.extract_best(numpy_package, conditions, k=5) == all_packages[:5]
+
+    pin_numpy = PinnedPackage.from_specifier("numpy", "1.20.0", ">=1.20.0")
+    assert (
+        pkg_extractor.extract_best(pin_numpy, conditions, k=3)
+        == pkg_extractor.extract_pinned_packages(pin_numpy, conditions)[:3]
+    )
+
+
+def test_extract_best_stops_at_first_match(cache_with_numpy, numpy_package):
+    pkg_extractor = PackageCacheExtractor(CondaCache(cache_dir=cache_with_numpy))
+    conditions: Packages = [Package(name="python", version="3.8.9", build_number=None, build=None)]
+    with mock.patch.object(
+        PackageCacheExtractor,
+        "_check_conditions_on_pkg_requirements",
+        wraps=PackageCacheExtractor._check_conditions_on_pkg_requirements,
+    ) as check:
+        best = pkg_extractor.extract_best(numpy_package, conditions)
+    assert best[0].version == "1.23.3"
+    assert check.call_count < len(pkg_extractor.extract_packages(numpy_package, []))
@@ -0,0 +1,72 @@
+import mock
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.channels import (
+    cache_namespace,
+    current_subdir,
+    normalize_channel,
+)
+from sxm_tmk.core.conda.commands import MambaSearch
+from sxm_tmk.tests.conda.test_cache import SOMETHING_1_0_0
+
+
+def test_normalize_channel():
+    assert normalize_channel("conda-forge") == "https://conda.anaconda.org/conda-forge"
+    assert normalize_channel("https://conda.anaconda.org/conda-forge/") == "https://conda.anaconda.org/conda-forge"
+    assert normalize_channel("defaults") == "defaults"
+    assert normalize_channel("/opt/channel") == "/opt/channel"
+
+
+def test_current_subdir_honours_conda_subdir():
+    with mock.patch.dict("os.environ", {"CONDA_SUBDIR": "osx-64"}):
+        assert current_subdir() == "osx-64"
+
+
+def test_cache_namespace():
+    assert cache_namespace(subdir="linux-64") == "linux-64"
+    assert cache_namespace(["conda-forge", "bioconda"], "linux-64") == cache_namespace(
+        ["https://conda.anaconda.org/bioconda", "conda-forge/"], "linux-64"
+    )
+    assert cache_namespace(["conda-forge"], "linux-64") != cache_namespace(["bioconda"], "linux-64")
+    assert cache_namespace(["conda-forge"], "linux-64") != cache_namespace(["conda-forge"], "osx-arm64")
+
+
+def test_cache_entries_are_namespaced(tmp_path):
+    linux_cache = CondaCache(tmp_path, subdir="linux-64")
+    osx_cache = CondaCache(tmp_path, subdir="osx-arm64")
+    forge_cache = CondaCache(tmp_path, channels=["conda-forge"], subdir="linux-64")
+    linux_cache.store("something", SOMETHING_1_0_0)
+    assert "something" in linux_cache
+    assert "something" not in osx_cache
+    assert "something" not in forge_cache
+
+
+def test_cache_reads_entries_stored_before_namespacing(tmp_path):
+    (tmp_path / "something.json").write_text(SOMETHING_1_0_0)
+    assert CondaCache(tmp_path).builds("something")[0].version == "1.0.0"
+    assert "something" not in CondaCache(tmp_path, channels=["conda-forge"])
+
+
+def test_cache_reads_entries_stored_before_namespacing_for_the_host_platform_only(tmp_path):
+    (tmp_path / "something.json").write_text(SOMETHING_1_0_0)
+    with mock.patch.dict("os.environ", {"CONDA_SUBDIR": "linux-64"}):
+        assert "something" in CondaCache(tmp_path, subdir="linux-64")
+        assert "something" not in CondaCache(tmp_path, subdir="osx-arm64")
+        assert CondaCache(tmp_path, subdir="osx-arm64").builds("something") is None
+
+
+@mock.patch("sxm_tmk.core.conda.commands.subprocess.check_output", return_value=b"{}")
+def test_search_passes_channels_and_subdir(mock_check_output):
+    MambaSearch(channels=["conda-forge", "bioconda"], subdir="linux-64").execute("numpy")
+    assert mock_check_output.call_args[0][0] == [
+        "mamba",
+        "search",
+        "--json",
+        "-c",
+        "conda-forge",
+        "-c",
+        "bioconda",
+        "--subdir",
+        "linux-64",
+        "numpy",
+    ]
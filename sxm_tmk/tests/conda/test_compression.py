@@ -0,0 +1,33 @@
+import pytest
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.compression import check_compression, compress, decompress
+from sxm_tmk.tests.conda.test_cache import SOMETHING_1_0_0
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_compression_round_trip(compression):
+    payload = SOMETHING_1_0_0.encode("utf8")
+    assert decompress(compress(payload, compression)) == payload
+
+
+def test_zstd_compression_round_trip():
+    pytest.importorskip("zstandard")
+    payload = SOMETHING_1_0_0.encode("utf8")
+    assert decompress(compress(payload, "zstd")) == payload
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError, match='Unknown cache compression "lz4"'):
+        check_compression("lz4")
+
+
+def test_cache_reads_entries_whatever_their_compression(tmp_path):
+    gzip_cache = CondaCache(tmp_path, compression="gzip")
+    gzip_cache.store("something", SOMETHING_1_0_0)
+    plain_cache = CondaCache(tmp_path)
+    plain_cache.store("other", SOMETHING_1_0_0.replace("something", "other"))
+
+    assert (tmp_path / f"something@{gzip_cache.namespace}.json").read_bytes()[:2] == b"\x1f\x8b"
+    assert plain_cache.builds("something")[0].version == "1.0.0"
+    assert gzip_cache.builds("other")[0].version == "1.0.0"
@@ -0,0 +1,49 @@
+import threading
+
+from sxm_tmk.core.conda.concurrency import AdaptiveConcurrency
+
+
+def test_concurrency_ramps_up_to_max_jobs():
+    concurrency = AdaptiveConcurrency(4, load=lambda: 0.0)
+    assert concurrency.limit == 2
+    for _ in range(5):
+        concurrency.release(concurrency.acquire())
+    assert concurrency.limit == 4
+
+
+def test_concurrency_backs_off_on_slow_searches():
+    concurrency = AdaptiveConcurrency(8, load=lambda: 0.0)
+    concurrency.release(concurrency.acquire() - 1.0)
+    concurrency.release(concurrency.acquire() - 1.0)
+    limit = concurrency.limit
+    first, second = concurrency.acquire(), concurrency.acquire()
+    concurrency.release(first - 10.0)
+    assert concurrency.limit == limit // 2
+    # Started before the decrease: does not decrease again.
+    concurrency.release(second - 10.0)
+    assert concurrency.limit == limit // 2
+
+
+def test_concurrency_does_not_ramp_up_on_loaded_machine():
+    concurrency = AdaptiveConcurrency(8, load=lambda: 4.0)
+    for _ in range(5):
+        concurrency.release(concurrency.acquire())
+    assert concurrency.limit == 1
+
+
+def test_concurrency_bounds_running_searches():
+    concurrency = AdaptiveConcurrency(2, load=lambda: 0.0)
+    concurrency.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        concurrency.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    concurrency.release(0.0)
+    assert acquired.wait(1)
+    thread.join()
+    assert concurrency.peak == 1
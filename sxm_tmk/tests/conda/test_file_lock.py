@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from sxm_tmk.core.conda.file_lock_wrapper import (
+    CannotAcquireLock,
+    CannotUpgradeLock,
+    FcntlReadWriteLock,
+)
+
+
+def _in_thread(func):
+    result = {}
+
+    def run():
+        try:
+            result["value"] = func()
+        except Exception as e:
+            result["error"] = e
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
+
+
+def _try_acquire(lock, shared):
+    def attempt():
+        lock.acquire(timeout=0, shared=shared)
+        lock.release()
+        return True
+
+    return attempt
+
+
+def test_shared_holders_do_not_exclude_each_other(tmp_path):
+    lock = FcntlReadWriteLock(tmp_path / "tmk.lock")
+    lock.acquire(shared=True)
+    try:
+        assert _in_thread(_try_acquire(lock, shared=True))
+        with pytest.raises(CannotAcquireLock):
+            _in_thread(_try_acquire(lock, shared=False))
+    finally:
+        lock.release()
+    assert _in_thread(_try_acquire(lock, shared=False))
+
+
+def test_exclusive_holder_excludes_readers(tmp_path):
+    lock = FcntlReadWriteLock(tmp_path / "tmk.lock")
+    lock.acquire()
+    try:
+        with pytest.raises(CannotAcquireLock):
+            _in_thread(_try_acquire(lock, shared=True))
+    finally:
+        lock.release()
+
+
+def test_lock_is_reentrant_per_thread(tmp_path):
+    lock = FcntlReadWriteLock(tmp_path / "tmk.lock")
+    lock.acquire()
+    lock.acquire(shared=True)
+    lock.release()
+    assert lock.locked()
+    lock.release()
+    assert not lock.locked()
+
+
+def test_shared_lock_cannot_be_upgraded(tmp_path):
+    lock = FcntlReadWriteLock(tmp_path / "tmk.lock")
+    lock.acquire(shared=True)
+    try:
+        with pytest.raises(CannotUpgradeLock):
+            lock.acquire()
+    finally:
+        lock.release()
+
+
+def test_lock_statistics_record_waits(tmp_path):
+    lock = FcntlReadWriteLock(tmp_path / "tmk.lock")
+    lock.acquire()
+    waiter = threading.Thread(target=lambda: (lock.acquire(shared=True), lock.release()))
+    waiter.start()
+    time.sleep(0.2)
+    lock.release()
+    waiter.join()
+
+    stats = lock.statistics
+    assert stats["exclusive"]["acquisitions"] == 1
+    assert stats["exclusive"]["contended"] == 0
+    assert stats["shared"]["acquisitions"] == 1
+    assert stats["shared"]["contended"] == 1
+    assert stats["shared"]["max_wait"] >= 0.15
+    assert stats["shared"]["total_wait"] == stats["shared"]["max_wait"]
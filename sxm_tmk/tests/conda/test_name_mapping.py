@@ -0,0 +1,60 @@
+import pathlib
+
+import pytest
+
+from sxm_tmk.core.conda.name_mapping import (
+    NameMapping,
+    build_name_mapping,
+    canonicalize_name,
+    load_name_mapping,
+)
+from sxm_tmk.core.conda.repodata import RepodataSearch
+
+CHANNEL = pathlib.Path(__file__).parent.parent / "data" / "channel"
+
+
+@pytest.mark.parametrize(
+    ("name", "expected"), [("PyYAML", "pyyaml"), ("ruamel_yaml", "ruamel-yaml"), ("Zope.Interface", "zope-interface")]
+)
+def test_canonicalize_name(name, expected):
+    assert canonicalize_name(name) == expected
+
+
+def test_shipped_name_mapping(tmp_path):
+    name_mapping = load_name_mapping(tmp_path / "no_refreshed_table.json")
+    assert name_mapping.conda_name("torch") == "pytorch"
+    assert name_mapping.conda_name("msgpack") == "msgpack-python"
+    assert name_mapping.conda_name("typing-extensions") == "typing_extensions"
+    assert name_mapping.conda_name("Typing_Extensions") == "typing_extensions"
+    # Without the names of the channels, any other project may be on conda.
+    assert name_mapping.conda_name("PyYAML") == "pyyaml"
+    assert name_mapping.conda_name("some-internal-package") == "some-internal-package"
+
+
+def test_build_name_mapping():
+    name_mapping = build_name_mapping(
+        ["pyyaml", "msgpack-python", "python-dateutil", "pytorch", "ruamel.yaml", "graphviz", "python-graphviz"],
+        overrides={"torch": "pytorch", "graphviz": "python-graphviz", "opencv-python": "opencv"},
+    )
+    assert name_mapping.conda_name("PyYAML") == "pyyaml"
+    assert name_mapping.conda_name("msgpack") == "msgpack-python"
+    assert name_mapping.conda_name("ruamel.yaml") == "ruamel.yaml"
+    assert name_mapping.conda_name("ruamel-yaml") == "ruamel.yaml"
+    assert name_mapping.conda_name("torch") == "pytorch"
+    assert name_mapping.conda_name("graphviz") == "python-graphviz"
+    # Not on these channels: no need to search them.
+    assert name_mapping.conda_name("opencv-python") is None
+    assert name_mapping.conda_name("some-internal-package") is None
+
+
+def test_name_mapping_dump_and_load(tmp_path):
+    name_mapping = build_name_mapping(
+        {name for index in RepodataSearch(paths=[CHANNEL.as_posix()]).indexes() for name in index.names()},
+        overrides={},
+    )
+    name_mapping.dump(tmp_path / "pypi_to_conda.json")
+    loaded = load_name_mapping(tmp_path / "pypi_to_conda.json")
+    assert isinstance(loaded, NameMapping)
+    assert loaded.conda_names == {"numpy", "python", "attrs"}
+    assert loaded.conda_name("NumPy") == "numpy"
+    assert loaded.conda_name("requests") is None
@@ -1,11 +1,23 @@
-from subprocess import CalledProcessError
+import datetime
+import subprocess
+import sys
+import threading
+import time
+from subprocess import CalledProcessError, TimeoutExpired
 
 import mock
+import pytest
 import ujson
 
-from sxm_tmk.core.conda.cache import CondaCache
-from sxm_tmk.core.conda.commands import MambaSearch
-from sxm_tmk.core.conda.repo import QueryPlan, SearchStatus, search
+from sxm_tmk.core.conda.cache import CondaCache, Freshness
+from sxm_tmk.core.conda.commands import MambaSearch, batch_spec
+from sxm_tmk.core.conda.repo import (
+    QueryPlan,
+    SearchStatus,
+    refresh,
+    search,
+    search_batch,
+)
 from sxm_tmk.core.dependency import Package
 from sxm_tmk.core.out.terminal import Progress
 
@@ -13,13 +25,87 @@ from sxm_tmk.core.out.terminal import Progress
 def test_search_mamba_package_issue(tmp_path):
     cache = CondaCache(tmp_path)
     task = Progress("").add_task("mamba", 1)
-    command = MambaSearch()
+    command = MambaSearch(retries=2, backoff=0)
     with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
         mocked_search.side_effect = CalledProcessError(3, cmd="mamba search something")
         result, pkg = search(command, "some-package", cache, task)
-        assert result == SearchStatus.NOT_FOUND
+        assert result == SearchStatus.FAILED
         assert pkg == "some-package"
+    assert mocked_search.call_count == 3
+    # A failure says nothing about the package, it is searched again next time.
+    assert not cache.is_known_missing("some-package")
+
+
+def test_search_mamba_retries_until_answered(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 1)
+    command = MambaSearch(retries=2, backoff=0)
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.side_effect = [
+            TimeoutExpired("mamba search numpy", 300),
+            ujson.dumps({"error": "CondaHTTPError: HTTP 000 CONNECTION FAILED"}),
+            ujson.dumps({"numpy": [{"version": "1.2.3"}]}),
+        ]
+        assert search(command, "numpy", cache, task) == (SearchStatus.FOUND_IN_REPOSITORY, "numpy")
+    assert mocked_search.call_count == 3
+    assert mocked_search.call_args.kwargs["timeout"] == command.timeout
+
+
+def test_search_retry_policy():
+    command = MambaSearch(retries=2, backoff=1)
+    error = ujson.dumps({"error": "CondaHTTPError: HTTP 000 CONNECTION FAILED"})
+    searches = command.searches(["numpy"])
+    assert next(searches) == (0.0, "numpy")
+    delay, spec = searches.send(None)
+    assert delay > 0 and spec == "numpy"
+    assert searches.send(error)[1] == "numpy"
+    with pytest.raises(StopIteration) as stop:
+        searches.send(error)
+    assert stop.value.value is None
+    # Batches are not retried.
+    batch = command.searches(["numpy", "scipy"])
+    assert next(batch) == (0.0, batch_spec(["numpy", "scipy"]))
+    with pytest.raises(StopIteration) as stop:
+        batch.send(None)
+    assert stop.value.value is None
+
+
+def test_search_mamba_not_found_reported_with_error_status(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 1)
+    command = MambaSearch(retries=2, backoff=0)
+    output = ujson.dumps({"error": "PackagesNotFoundError: thingy", "exception_name": "PackagesNotFoundError"})
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.side_effect = CalledProcessError(1, cmd="mamba search thingy", output=output.encode("utf8"))
+        assert search(command, "thingy", cache, task) == (SearchStatus.NOT_FOUND, "thingy")
     mocked_search.assert_called_once()
+    assert cache.is_known_missing("thingy")
+
+
+def test_search_mamba_crash_message_is_a_failure(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 1)
+    command = MambaSearch(retries=1, backoff=0)
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.side_effect = CalledProcessError(
+            1, cmd="mamba search numpy", output=b"critical libmamba Could not open lockfile"
+        )
+        assert search(command, "numpy", cache, task) == (SearchStatus.FAILED, "numpy")
+        assert command.execute_many(["numpy", "scipy"]) is None
+    assert mocked_search.call_count == 3
+    assert "numpy" not in cache
+    assert not cache.is_known_missing("numpy")
+
+
+def test_search_mamba_error_left_after_retries_is_a_failure(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 1)
+    command = MambaSearch(retries=1, backoff=0)
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.return_value = ujson.dumps({"error": "CondaHTTPError: HTTP 000 CONNECTION FAILED"})
+        assert command.execute("numpy") is None
+        assert search(command, "numpy", cache, task) == (SearchStatus.FAILED, "numpy")
+    assert mocked_search.call_count == 4
 
 
 def test_search_mamba_package_not_found(tmp_path):
@@ -100,8 +186,212 @@ def test_query_plan_search_result(tmp_path):
     # We want one value from the pool
     a_cache.store("pytest", ujson.dumps({"pytest": [{"version": "4.5.6"}]}))
 
-    q = QueryPlan(jobs=1, cache=a_cache)
+    q = QueryPlan(jobs=1, cache=a_cache, batch_size=1)
     with mock.patch("sxm_tmk.core.conda.repo.search", side_effect=search_mamba_for_replacement) as search_mock:
         q.search_and_mark(all_pkgs_to_search, task)
-    assert search_mock.call_count == 3
-    assert q.stats == {"not_found": ["thingy"], "found": ["numpy", "pytest"]}
+    # pytest is found in cache without searching it
+    assert search_mock.call_count == 2
+    assert q.stats == {"not_found": ["thingy"], "found": ["numpy", "pytest"], "failed": []}
+
+
+def test_batch_spec_matches_names_exactly():
+    assert batch_spec(["numpy", "zope.interface"]) == r"^(numpy|zope\.interface)$"
+
+
+def test_search_batch_splits_results_per_package(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 3)
+    cache.store("pytest", ujson.dumps({"pytest": [{"version": "4.5.6"}]}))
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.return_value = ujson.dumps({"numpy": [{"version": "1.2.3"}], "scipy": [{"version": "1.9.0"}]})
+        results = search_batch(command, ["numpy", "pytest", "scipy", "thingy"], cache, task)
+    mocked_search.assert_called_once()
+    assert mocked_search.call_args[0][-1] == "^(numpy|scipy|thingy)$"
+    assert sorted(results, key=lambda r: r[1]) == [
+        (SearchStatus.FOUND_IN_REPOSITORY, "numpy"),
+        (SearchStatus.FOUND_IN_CACHE, "pytest"),
+        (SearchStatus.FOUND_IN_REPOSITORY, "scipy"),
+        (SearchStatus.NOT_FOUND, "thingy"),
+    ]
+    assert cache.builds("numpy")[0].version == "1.2.3"
+    assert cache.builds("scipy")[0].version == "1.9.0"
+
+
+def test_search_batch_falls_back_to_one_search_per_package(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 2)
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.side_effect = [
+            CalledProcessError(1, cmd="mamba search ^(numpy|thingy)$"),
+            ujson.dumps({"numpy": [{"version": "1.2.3"}]}),
+            ujson.dumps({"error": "PackagesNotFoundError"}),
+        ]
+        results = search_batch(command, ["numpy", "thingy"], cache, task)
+    assert mocked_search.call_count == 3
+    assert results == [(SearchStatus.FOUND_IN_REPOSITORY, "numpy"), (SearchStatus.NOT_FOUND, "thingy")]
+
+
+def test_search_batch_without_any_package_falls_back_to_one_search_per_package(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 2)
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.side_effect = [
+            ujson.dumps({}),
+            ujson.dumps({"numpy": [{"version": "1.2.3"}]}),
+            ujson.dumps({"error": "PackagesNotFoundError"}),
+        ]
+        results = search_batch(command, ["numpy", "thingy"], cache, task)
+    assert mocked_search.call_count == 3
+    assert results == [(SearchStatus.FOUND_IN_REPOSITORY, "numpy"), (SearchStatus.NOT_FOUND, "thingy")]
+    assert not cache.is_known_missing("numpy")
+
+
+def test_query_plan_warm_run_does_not_search(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("numpy", ujson.dumps({"numpy": [{"version": "1.2.3"}]}))
+    a_cache.store("pytest", ujson.dumps({"pytest": [{"version": "4.5.6"}]}))
+    packages = [Package(name, version="1.0.0", build_number=None, build=None) for name in ("numpy", "pytest")]
+    q = QueryPlan(jobs=2, cache=a_cache)
+    with mock.patch("sxm_tmk.core.conda.commands.Executable.run_in_executor") as mocked_search:
+        q.search_and_mark(packages, Progress("").add_task("mamba", len(packages)))
+    mocked_search.assert_not_called()
+    assert q.found_pkgs == ["numpy", "pytest"]
+
+
+def test_query_plan_warm_run_does_not_probe_backends(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("numpy", ujson.dumps({"numpy": [{"version": "1.2.3"}]}))
+    packages = [Package("numpy", version="1.0.0", build_number=None, build=None)]
+    with mock.patch("sxm_tmk.core.conda.backends.select_backend") as mocked_select:
+        q = QueryPlan(cache=a_cache, backend="auto")
+        q.search_and_mark(packages, Progress("").add_task("mamba", len(packages)))
+        q.revalidator.wait(5)
+    mocked_select.assert_not_called()
+    assert q.found_pkgs == ["numpy"]
+
+
+def test_query_plan_honours_jobs(tmp_path):
+    packages = [Package(f"package-{i}", version="1.0.0", build_number=None, build=None) for i in range(20)]
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def mamba_search(*args, **kwargs):
+        with lock:
+            running.append(args[-1])
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(args[-1])
+        return ujson.dumps({"error": "PackagesNotFoundError"})
+
+    q = QueryPlan(jobs=3, cache=CondaCache(tmp_path), batch_size=1)
+    with mock.patch("sxm_tmk.core.conda.commands.Executable.run_in_executor", side_effect=mamba_search):
+        q.search_and_mark(packages, Progress("").add_task("mamba", len(packages)))
+    assert max(peak) <= 3
+    assert q.not_found_pkgs == [package.name for package in packages]
+
+
+def test_search_remembers_packages_not_found(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 2)
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.return_value = ujson.dumps(
+            {"error": "PackagesNotFoundError: ...", "exception_name": "PackagesNotFoundError"}
+        )
+        assert search(command, "thingy", cache, task) == (SearchStatus.NOT_FOUND, "thingy")
+        assert search(command, "thingy", cache, task) == (SearchStatus.NOT_FOUND, "thingy")
+    mocked_search.assert_called_once()
+    assert cache.is_known_missing("thingy")
+
+
+def test_search_failures_are_not_remembered(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 1)
+    command = MambaSearch(retries=0)
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.return_value = ujson.dumps({"error": "CondaHTTPError: HTTP 000 CONNECTION FAILED"})
+        assert search(command, "thingy", cache, task) == (SearchStatus.FAILED, "thingy")
+    assert not cache.is_known_missing("thingy")
+
+
+def _store_searched_ago(cache: CondaCache, pkg: str, version: str, seconds: float):
+    query_date = datetime.datetime.now().timestamp() - seconds
+    with mock.patch("sxm_tmk.core.conda.cache.datetime") as mocked_datetime:
+        mocked_datetime.datetime.now.return_value = datetime.datetime.fromtimestamp(query_date)
+        cache.store(pkg, ujson.dumps({pkg: [{"version": version}]}))
+
+
+def test_query_plan_serves_stale_entries_and_refreshes_them(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, soft_ttl=100, hard_ttl=1000)
+    _store_searched_ago(a_cache, "numpy", "1.2.3", 200)
+    packages = [Package("numpy", version="1.0.0", build_number=None, build=None)]
+    q = QueryPlan(cache=a_cache)
+    refreshed = threading.Event()
+
+    def mamba_search(*args, **kwargs):
+        refreshed.wait(5)
+        return ujson.dumps({"numpy": [{"version": "1.2.4"}]})
+
+    with mock.patch("sxm_tmk.core.conda.commands.Executable.run_in_executor", side_effect=mamba_search) as mamba:
+        q.search_and_mark(packages, Progress("").add_task("mamba", 1))
+        # Served without waiting for the refresh.
+        assert q.found_pkgs == ["numpy"]
+        assert a_cache.builds("numpy")[0].version == "1.2.3"
+        refreshed.set()
+        q.revalidator.wait(5)
+    mamba.assert_called_once()
+    assert "--use-index-cache" not in mamba.call_args[0]
+    assert a_cache.builds("numpy")[0].version == "1.2.4"
+    assert a_cache.freshness("numpy") == Freshness.FRESH
+
+
+def test_refresh_keeps_entries_missing_from_the_result(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path)
+    a_cache.store("numpy", ujson.dumps({"numpy": [{"version": "1.2.3"}]}))
+    a_cache.store("scipy", ujson.dumps({"scipy": [{"version": "1.9.0"}]}))
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        mocked_search.return_value = ujson.dumps({"scipy": [{"version": "1.9.1"}]})
+        refresh(command, ["numpy", "scipy"], a_cache)
+    assert a_cache.builds("numpy")[0].version == "1.2.3"
+    assert not a_cache.is_known_missing("numpy")
+    assert a_cache.builds("scipy")[0].version == "1.9.1"
+
+
+def test_query_plan_searches_expired_entries(tmp_path):
+    a_cache: CondaCache = CondaCache(tmp_path, soft_ttl=100, hard_ttl=1000)
+    _store_searched_ago(a_cache, "numpy", "1.2.3", 2000)
+    packages = [Package("numpy", version="1.0.0", build_number=None, build=None)]
+    q = QueryPlan(cache=a_cache)
+    with mock.patch(
+        "sxm_tmk.core.conda.commands.Executable.run_in_executor",
+        return_value=ujson.dumps({"numpy": [{"version": "1.2.4"}]}),
+    ):
+        q.search_and_mark(packages, Progress("").add_task("mamba", 1))
+    assert a_cache.builds("numpy")[0].version == "1.2.4"
+
+
+REVALIDATION_HUNG_AT_EXIT = """
+import pathlib
+import sys
+import time
+
+import mock
+
+from sxm_tmk.core.conda import repo
+from sxm_tmk.core.conda.cache import CondaCache
+
+repo.EXIT_WAIT = 0.5
+mock.patch("sxm_tmk.core.conda.commands.Executable.run_in_executor", side_effect=lambda *a, **k: time.sleep(60)).start()
+repo.Revalidator(CondaCache(pathlib.Path(sys.argv[1]))).submit(["numpy"])
+"""
+
+
+def test_revalidation_is_abandoned_at_exit(tmp_path):
+    # The hung search lasts a minute: waiting for it would time out.
+    subprocess.run([sys.executable, "-c", REVALIDATION_HUNG_AT_EXIT, tmp_path.as_posix()], check=True, timeout=30)
@@ -0,0 +1,73 @@
+import pathlib
+
+import pytest
+import ujson
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.repo import QueryPlan, SearchStatus, create_search, search
+from sxm_tmk.core.conda.repodata import RepodataSearch, find_repodata, load_index
+from sxm_tmk.core.dependency import Package
+from sxm_tmk.core.out.terminal import Progress
+
+CHANNEL = pathlib.Path(__file__).parent.parent / "data" / "channel"
+
+
+def test_find_repodata_of_local_channel():
+    assert [p.parent.name for p in find_repodata([CHANNEL.as_posix()])] == ["linux-64", "noarch", "osx-arm64"]
+
+
+def test_repodata_index():
+    index = load_index(CHANNEL / "linux-64" / "repodata.json")
+    assert index.subdir == "linux-64"
+    assert sorted(record["version"] for record in index.search("numpy")) == ["1.23.5", "1.24.1"]
+    assert "attrs" not in index
+    assert load_index(CHANNEL / "linux-64" / "repodata.json") is index
+
+
+def test_repodata_search_honours_subdir():
+    method = RepodataSearch(subdir="osx-arm64", paths=[CHANNEL.as_posix()])
+    result = ujson.loads(method.execute("numpy"))
+    assert {record["subdir"] for record in result["numpy"]} == {"osx-arm64"}
+    assert ujson.loads(method.execute("attrs"))["attrs"][0]["subdir"] == "noarch"
+
+
+def test_repodata_search_not_found():
+    method = RepodataSearch(subdir="linux-64", paths=[CHANNEL.as_posix()])
+    assert "error" in ujson.loads(method.execute("thingy"))
+    assert set(ujson.loads(method.execute_many(["numpy", "thingy", "python"]))) == {"numpy", "python"}
+
+
+def test_repodata_search_without_index_fails(tmp_path):
+    method = RepodataSearch(subdir="linux-64", paths=[(tmp_path / "missing").as_posix()])
+    assert method.execute("requests") is None
+    assert method.execute_many(["requests", "numpy"]) is None
+    cache = CondaCache(tmp_path / "cache")
+    assert search(method, "requests", cache, Progress("").add_task("repodata", 1)) == (SearchStatus.FAILED, "requests")
+    assert not cache.is_known_missing("requests")
+
+
+def test_repodata_channel_from_cached_url(tmp_path):
+    repodata = ujson.loads((CHANNEL / "linux-64" / "repodata.json").read_text())
+    repodata["_url"] = "https://conda.anaconda.org/conda-forge/linux-64"
+    (tmp_path / "0123abcd.json").write_text(ujson.dumps(repodata))
+    assert load_index(tmp_path / "0123abcd.json").channel == "https://conda.anaconda.org/conda-forge"
+
+    paths = [(tmp_path / "0123abcd.json").as_posix()]
+    assert RepodataSearch(channels=["conda-forge"], subdir="linux-64", paths=paths).indexes()
+    assert not RepodataSearch(channels=["bioconda"], subdir="linux-64", paths=paths).indexes()
+
+
+def test_query_plan_on_repodata_backend(tmp_path):
+    a_cache = CondaCache(tmp_path, subdir="linux-64")
+    packages = [Package(name, version="1.0.0", build_number=None, build=None) for name in ("numpy", "attrs", "thingy")]
+    task = Progress("").add_task("repodata", len(packages))
+    q = QueryPlan(cache=a_cache, subdir="linux-64", backend="repodata", repodata=[CHANNEL.as_posix()])
+    q.search_and_mark(packages, task)
+    assert sorted(q.found_pkgs) == ["attrs", "numpy"]
+    assert q.not_found_pkgs == ["thingy"]
+    assert len(a_cache.builds("numpy")) == 2
+
+
+def test_create_search_unknown_backend():
+    with pytest.raises(ValueError, match='Unknown search backend "pip"'):
+        create_search("pip")
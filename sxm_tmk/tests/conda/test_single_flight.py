@@ -0,0 +1,92 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+import ujson
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.commands import MambaSearch
+from sxm_tmk.core.conda.repo import SearchStatus, search
+from sxm_tmk.core.conda.single_flight import SingleFlight
+from sxm_tmk.core.out.terminal import Progress
+
+
+def test_single_flight_claim(tmp_path):
+    single_flight = SingleFlight(tmp_path)
+    assert single_flight.claim("numpy")
+    assert (tmp_path / "numpy.inflight").read_text() == f"{socket.gethostname()}:{os.getpid()}"
+    assert not single_flight.claim("numpy")
+    assert not SingleFlight(tmp_path).claim("numpy")
+    assert single_flight.in_flight("numpy")
+    single_flight.release("numpy")
+    assert not (tmp_path / "numpy.inflight").exists()
+    assert not single_flight.in_flight("numpy")
+
+
+def test_single_flight_reclaims_claims_of_dead_processes(tmp_path):
+    dead_process = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead_process.wait()
+    (tmp_path / "numpy.inflight").write_text(f"{socket.gethostname()}:{dead_process.pid}")
+    assert SingleFlight(tmp_path).claim("numpy")
+
+
+def test_single_flight_reclaims_old_claims(tmp_path):
+    (tmp_path / "numpy.inflight").write_text("another-host:1")
+    assert not SingleFlight(tmp_path).claim("numpy")
+    os.utime(tmp_path / "numpy.inflight", (time.time() - 1000, time.time() - 1000))
+    assert SingleFlight(tmp_path, stale_after=100).claim("numpy")
+
+
+def test_single_flight_keeps_old_claims_of_live_processes(tmp_path):
+    (tmp_path / "numpy.inflight").write_text(f"{socket.gethostname()}:{os.getpid()}")
+    os.utime(tmp_path / "numpy.inflight", (time.time() - 1000, time.time() - 1000))
+    assert not SingleFlight(tmp_path, stale_after=100).claim("numpy")
+
+
+def test_single_flight_reclaims_old_empty_claims(tmp_path):
+    (tmp_path / "numpy.inflight").touch()
+    assert not SingleFlight(tmp_path, stale_after=100).claim("numpy")
+    os.utime(tmp_path / "numpy.inflight", (time.time() - 1000, time.time() - 1000))
+    assert SingleFlight(tmp_path, stale_after=100).claim("numpy")
+
+
+def _slow_search(*args, **kwargs):
+    time.sleep(0.2)
+    return ujson.dumps({"numpy": [{"version": "1.2.3"}]})
+
+
+def test_concurrent_searches_of_a_package_run_once(tmp_path):
+    cache = CondaCache(tmp_path)
+    task = Progress("").add_task("mamba", 4)
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor", side_effect=_slow_search) as mocked_search:
+        with ThreadPoolExecutor(max_workers=4) as tp:
+            results = list(tp.map(lambda _: search(command, "numpy", cache, task), range(4)))
+    mocked_search.assert_called_once()
+    assert sorted(status.value for status, _ in results) == ["found"] * 4
+    assert not (tmp_path / f"numpy@{cache.namespace}.inflight").exists()
+
+
+def test_search_waits_for_other_processes(tmp_path):
+    # Another CondaCache instance has its own in-process claims: it stands for another process.
+    other_process_cache = CondaCache(tmp_path)
+    assert other_process_cache.single_flight.claim("numpy")
+
+    def complete_search():
+        time.sleep(0.3)
+        other_process_cache.store("numpy", ujson.dumps({"numpy": [{"version": "1.2.3"}]}))
+        other_process_cache.single_flight.release("numpy")
+
+    thread = threading.Thread(target=complete_search)
+    thread.start()
+    command = MambaSearch()
+    with mock.patch.object(command, attribute="run_in_executor") as mocked_search:
+        result = search(command, "numpy", CondaCache(tmp_path), Progress("").add_task("mamba", 1))
+    thread.join()
+    mocked_search.assert_not_called()
+    assert result == (SearchStatus.FOUND_IN_CACHE, "numpy")
@@ -0,0 +1,100 @@
+import mock
+import pytest
+import ujson
+
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.storage import (
+    EntryInfo,
+    JSONDirectoryStorage,
+    SQLiteStorage,
+    create_storage,
+    migrate_json_directory,
+)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_storage_read_write_delete(backend, tmp_path):
+    storage = create_storage(backend, tmp_path)
+    assert not storage.exists("numpy")
+    assert storage.read("numpy") is None
+
+    payload = ujson.dumps({"numpy": [], "sxm_tmk": {"query_date": 12.0}}).encode("utf8")
+    storage.write("numpy", payload, 12.0)
+    assert storage.exists("numpy")
+    assert storage.read("numpy") == payload
+
+    entries = list(storage.entries())
+    assert len(entries) == 1
+    assert entries[0].key == "numpy"
+    assert entries[0].query_date == 12.0
+    assert entries[0].size == len(payload)
+    assert storage.query_date("numpy") == 12.0
+    assert storage.query_date("pytest") is None
+
+    assert storage.delete("numpy") == len(payload)
+    assert not storage.exists("numpy")
+    assert storage.delete("numpy") == 0
+
+
+def test_unknown_storage(tmp_path):
+    with pytest.raises(ValueError, match='Unknown cache backend "nope"'):
+        create_storage("nope", tmp_path)
+
+
+def test_sqlite_storage_is_a_single_file(tmp_path):
+    storage = SQLiteStorage(tmp_path)
+    storage.write("numpy", b"{}", 1.0)
+    storage.write("pytest", b"{}", 2.0)
+    assert [p.name for p in tmp_path.iterdir()] == [SQLiteStorage.FILE_NAME]
+
+
+def test_migrate_json_directory(cache_with_numpy):
+    json_storage = JSONDirectoryStorage(cache_with_numpy)
+    numpy_payload = json_storage.read("numpy")
+
+    sqlite_storage = SQLiteStorage(cache_with_numpy)
+    assert migrate_json_directory(sqlite_storage) == 1
+    assert sqlite_storage.read("numpy") == numpy_payload
+    assert not json_storage.exists("numpy")
+
+
+def test_migrate_json_directory_keep_files(cache_with_numpy):
+    sqlite_storage = SQLiteStorage(cache_with_numpy)
+    assert migrate_json_directory(sqlite_storage, keep_files=True) == 1
+    assert JSONDirectoryStorage(cache_with_numpy).exists("numpy")
+
+
+def test_migrate_json_directory_entries_without_date(tmp_path):
+    json_storage = JSONDirectoryStorage(tmp_path)
+    json_storage.write("numpy", ujson.dumps({"numpy": [], "sxm_tmk": {"query_date": 12.0}}).encode("utf8"), 1.0)
+    json_storage.write("scipy", ujson.dumps({"scipy": []}).encode("utf8"), 1.0)
+    undated = [EntryInfo(key="numpy", query_date=None, size=0), EntryInfo(key="scipy", query_date=None, size=0)]
+
+    sqlite_storage = SQLiteStorage(tmp_path)
+    with mock.patch.object(JSONDirectoryStorage, "entries", return_value=iter(undated)):
+        assert migrate_json_directory(sqlite_storage) == 2
+    assert sqlite_storage.query_date("numpy") == 12.0
+    assert sqlite_storage.query_date("scipy") > 1.0
+
+
+def test_cache_on_sqlite_backend(cache_with_numpy):
+    a_cache = CondaCache(cache_with_numpy, backend="sqlite")
+    assert "numpy" not in a_cache
+    assert a_cache.migrate_json_entries() == 1
+    assert "numpy" in a_cache
+    assert len(a_cache.get("numpy")["numpy"]) == 92
+
+    a_cache.store("something", ujson.dumps({"something": [{"version": "1.0.0"}]}))
+    assert "something" in a_cache
+    result = a_cache.clean(now=True)
+    assert result["deleted"] == 2
+    assert "something" not in a_cache
+    assert "numpy" not in a_cache
+
+
+def test_json_storage_query_date_is_file_mtime(tmp_path):
+    storage = JSONDirectoryStorage(tmp_path)
+    storage.write("numpy", b"{}", 1234.5)
+    assert (tmp_path / "numpy.json").stat().st_mtime == 1234.5
+    (tmp_path / "tmk.lock").touch()
+    assert [(entry.key, entry.query_date) for entry in storage.entries()] == [("numpy", 1234.5)]
@@ -0,0 +1,65 @@
+import json
+
+import mock
+import pytest
+import ujson
+
+from sxm_tmk.converters.pipenv import FromPipenv
+from sxm_tmk.core.conda.cache import CondaCache
+from sxm_tmk.core.conda.name_mapping import NameMapping
+
+OPENCV_4_6_0 = ujson.dumps(
+    {"opencv": [{"version": "4.6.0", "build": "py38_0", "build_number": 0, "depends": ["python >=3.8"]}]}
+)
+
+
+@pytest.fixture
+def opencv_project(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    lock = {
+        "_meta": {"requires": {"python_version": "3.8"}, "sources": []},
+        "default": {
+            "opencv-python": {"version": "==4.6.0"},
+            "opencv-python-headless": {"version": "==4.6.0"},
+        },
+        "develop": {},
+    }
+    (project / "Pipfile.lock").write_text(json.dumps(lock))
+    return project
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CondaCache(tmp_path / "cache")
+
+
+@pytest.fixture
+def converter(opencv_project, cache):
+    mapping = NameMapping({"opencv-python": "opencv", "opencv-python-headless": "opencv"})
+    with mock.patch("sxm_tmk.converters.pipenv.create_cache", return_value=cache), mock.patch(
+        "sxm_tmk.converters.pipenv.load_name_mapping", return_value=mapping
+    ):
+        yield FromPipenv(opencv_project, jobs=1)
+
+
+def _environment(converter, project):
+    converter.dump_environment()
+    return (project / "project.conda.yaml").read_text().splitlines()
+
+
+def test_projects_sharing_a_conda_name_are_installed_with_conda_once(converter, opencv_project, cache):
+    cache.store("opencv", OPENCV_4_6_0)
+    converter._solve_dependencies()
+    environment = _environment(converter, opencv_project)
+    assert environment.count(" - opencv=4.6.0") == 1
+    assert not any("opencv-python" in line for line in environment)
+
+
+def test_projects_sharing_a_conda_name_not_found_are_all_installed_with_pip(converter, opencv_project, cache):
+    cache.store_not_found("opencv")
+    converter._solve_dependencies()
+    environment = _environment(converter, opencv_project)
+    assert "   - opencv-python==4.6.0" in environment
+    assert "   - opencv-python-headless==4.6.0" in environment
+    assert not any(line.startswith(" - opencv") for line in environment)
@@ -0,0 +1,43 @@
+import pytest
+
+from sxm_tmk.core.config import Settings, load_settings, parse_size
+
+
+@pytest.mark.parametrize(
+    ("size", "expected"),
+    [
+        (None, None),
+        (1024, 1024),
+        ("1024", 1024),
+        ("2K", 2048),
+        ("2kb", 2048),
+        ("500M", 500 * 1024**2),
+        ("2G", 2 * 1024**3),
+        ("1.5GiB", int(1.5 * 1024**3)),
+    ],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_invalid_size():
+    with pytest.raises(ValueError, match='Invalid size "2X"'):
+        parse_size("2X")
+
+
+def test_load_settings_without_config(tmp_path):
+    assert load_settings(tmp_path / "config.yaml") == Settings()
+
+
+def test_load_settings(tmp_path):
+    config = tmp_path / "config.yaml"
+    config.write_text("cache:\n  backend: sqlite\n  max_size: 2G\n")
+    settings = load_settings(config)
+    assert settings.cache.backend == "sqlite"
+    assert settings.cache.max_size == 2 * 1024**3
+
+
+def test_load_settings_with_compression(tmp_path):
+    config = tmp_path / "config.yaml"
+    config.write_text("cache:\n  compression: gzip\n")
+    assert load_settings(config).cache.compression == "gzip"
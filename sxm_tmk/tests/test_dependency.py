@@ -9,6 +9,8 @@ from sxm_tmk.core.dependency import (
     Package,
     PinnedPackage,
     clean_version,
+    parse_specifier_set,
+    parsing_memo_stats,
 )
 
 
@@ -87,3 +89,35 @@ def test_invalid_constraint():
 )
 def test_clean_version(version, result):
     assert clean_version(version) == result
+
+
+def test_constraints_are_interned():
+    first = Constraint.from_conda_depends("python >=3.8,<3.9.0a0")
+    assert Constraint.from_conda_depends("python >=3.8,<3.9.0a0") is first
+    assert parse_specifier_set(">=3.8,<3.9.0a0") is parse_specifier_set(">=3.8,<3.9.0a0")
+
+
+def test_constraint_subclasses_are_not_interned():
+    class PythonConstraint(Constraint):
+        pass
+
+    constraint = PythonConstraint.from_conda_depends("python >=3.8,<3.9.0a0")
+    assert type(constraint) is PythonConstraint
+    assert constraint is not Constraint.from_conda_depends("python >=3.8,<3.9.0a0")
+
+
+def test_parsing_memo_stats():
+    Package("memo", version="9.8.7", build_number=None, build=None).parse_version()
+    before = parsing_memo_stats()["version"]
+    Package("memo", version="9.8.7", build_number=None, build=None).parse_version()
+    after = parsing_memo_stats()["version"]
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"]
+
+
+def test_parsed_version_follows_version_changes():
+    pkg = Package("test", version="1.2.3", build_number=None, build=None)
+    assert pkg.parse_version() is pkg.parse_version()
+    pkg.version = "1.2.4"
+    assert str(pkg.parse_version()) == "1.2.4"
+    assert pkg == Package("test", version="1.2.4", build_number=None, build=None)